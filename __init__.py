@@ -87,12 +87,14 @@ else:
 def register():
     #
     prop.register()
+    io.tby_session.register()
     bpy.utils.register_module(__name__)
 
 
 def unregister():
 
     prop.unregister()
+    io.tby_session.unregister()
     bpy.utils.unregister_module(__name__)
 
 
@@ -24,5 +24,14 @@ from . import tby_world
 from . import tby_integrator
 from . import tby_texture
 from . import tby_object
+from . import tby_geometry
+from . import tby_cache
+from . import tby_sceneindex
+from . import tby_session
+from . import tby_viewport
+from . import tby_result
+from . import tby_imageio
+from . import tby_texlod
+from . import tby_preflight
 from . import tby_light
 from . import tby_material
@@ -0,0 +1,116 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+import bpy
+import os
+from bpy.path import abspath
+
+
+def getCacheDir(scene, subdir):
+    # user defined directory, or one inside Blender's user data folder
+    root = scene.bounty.gs_cache_dir
+    if root:
+        root = os.path.normpath(os.path.realpath(abspath(root)))
+    else:
+        root = bpy.utils.user_resource('DATAFILES', path="thebounty_cache", create=True)
+    return os.path.join(root, subdir)
+
+
+class DiskCache(object):
+    """ Files stored by key in one directory, with a size cap.
+        The least recently used entries are evicted first, the file
+        modification time is used as the access stamp.
+    """
+    def __init__(self, directory, maxSize, suffix=""):
+        self.directory = directory
+        self.maxSize = maxSize
+        self.suffix = suffix
+        self.totalSize = None
+        self.hits = 0
+        self.misses = 0
+
+    def keyPath(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def lookup(self, key):
+        path = self.keyPath(key)
+        if os.path.exists(path):
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def store(self, key, writer):
+        # writer(path) fills the file, it is moved in place when done
+        path = self.keyPath(key)
+        temp = "{0}.{1}.tmp".format(path, os.getpid())
+        try:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            writer(temp)
+            os.replace(temp, path)
+        except (OSError, IOError) as e:
+            print("Exporter: Unable to write cache file {0}: {1}".format(path, e))
+            if os.path.exists(temp):
+                os.remove(temp)
+            return None
+
+        if self.totalSize is None:
+            self.totalSize = self.scanSize()
+        else:
+            self.totalSize += os.path.getsize(path)
+        if self.totalSize > self.maxSize:
+            self.evict()
+        return path
+
+    def entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for name in os.listdir(self.directory):
+            if self.suffix and not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def scanSize(self):
+        return sum(size for mtime, size, path in self.entries())
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total <= self.maxSize:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self.totalSize = total
@@ -23,16 +23,37 @@ import os
 import threading
 import time
 import yafrayinterface
+from collections import OrderedDict
 from .. import PLUGIN_PATH
 from .tby_object import exportObject
 from .tby_light  import exportLight
 from .tby_world  import exportWorld
 from .tby_integrator import exportIntegrator
 from . import tby_scene
+from . import tby_session
+from . import tby_viewport
+from .tby_result import ResultBuffer, ProgressReporter
+from . import tby_imageio
+from . import tby_texlod
+from . import tby_preflight
 from .tby_texture import exportTexture
 from .tby_material import TheBountyMaterialWrite
+from .tby_cache import DiskCache, getCacheDir
+from .tby_sceneindex import SceneIndex
+from . import tby_geometry
+from .tby_geometry import np
 from bpy import context
 
+# engine state set up by 'update' for one frame, kept by prepared animation frames
+frameState = ('scene', 'sceneIndex', 'session', 'yi', 'materialMap', 'exportedMaterials',
+              'geometry', 'lights', 'environment', 'lightIntegrator', 'yaf_texture', 'setMaterial',
+              'sizeX', 'sizeY', 'bStartX', 'bStartY', 'bsizeX', 'bsizeY', 'resX', 'resY',
+              'outputFile', 'output', 'file_type', 'fileAlpha', 'fileBits', 'fileInMemory', 'ih', 'co')
+
+# interval of the user break checks while the render thread runs
+breakCheckMin = 0.01
+breakCheckMax = 0.1
+
 switchFileType = {
     'PNG': 'png',
     'TARGA': 'tga',
@@ -47,8 +68,9 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
     bl_idname = 'THEBOUNTY'
     bl_use_preview = True
     bl_label = "TheBounty Render"
-    prog = 0.0
-    tag = ""
+    session = None
+    viewport = None
+    fileInMemory = False
     #useViewToRender = False
     #viewMatrix = None
     sceneMat = []
@@ -68,9 +90,17 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
     
     ##-----------------------------------------------------     
 
+    def useSession(self, scene):
+        # material previews follow the setting of the scene being edited
+        settings = bpy.context.scene.bounty if self.is_preview else scene.bounty
+        return settings.gs_persistent_session and scene.bounty.gs_type_render != "xml"
+
+    def newInterface(self):
+        if self.session is not None:
+            return self.session.getInterface()
+        return yafrayinterface.yafrayInterface_t()
+
     def setInterface(self, yi):
-        self.materialMap = {}
-        self.exportedMaterials = set()
         self.yi = yi
         # setup specific values for render preview mode
         if self.is_preview:
@@ -82,11 +112,30 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
             #
             self.verbositylevel(self.scene.bounty.gs_verbosity_level)
         
-        # export go.. load plugins
-        self.yi.loadPlugins(PLUGIN_PATH)
+        # chosen before the session is cleared, textures loaded with an
+        # other file than the one picked now are exported again
+        lodProxies = self.selectTextureProxies()
+        if self.session is not None:
+            # plugins are loaded once, unchanged textures and materials are kept
+            kept = self.session.prepare(self.scene, self.is_preview, lodProxies)
+            self.materialMap = self.session.materialMap
+            self.exportedMaterials = self.session.exportedMaterials
+            self.yi.printInfo("Exporter: Persistent session, render {0}, {1} textures and materials kept".format(
+                              self.session.renders, kept))
+        else:
+            self.materialMap = {}
+            self.exportedMaterials = set()
+            # export go.. load plugins
+            self.yi.loadPlugins(PLUGIN_PATH)
                 
+        # evaluated meshes cached on disk, keyed by geometry fingerprint
+        meshCache = None
+        if self.scene.bounty.gs_mesh_cache and not self.is_preview:
+            meshCache = DiskCache(getCacheDir(self.scene, "meshes"),
+                                  self.scene.bounty.gs_mesh_cache_size * 1024 * 1024, ".npz")
+
         # process geometry
-        self.geometry = exportObject(self.yi, self.materialMap, self.is_preview)
+        self.geometry = exportObject(self.yi, self.materialMap, self.is_preview, meshCache, self.session)
              
         # process lights
         self.lights = exportLight(self.yi, self.is_preview)
@@ -97,27 +146,75 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
         # process lighting integrators..
         self.lightIntegrator = exportIntegrator(self.yi, self.is_preview)
               
+        # generated and packed images written once to a disk cache
+        assetCache = None
+        if self.scene.bounty.gs_texture_cache and not self.is_preview:
+            assetCache = DiskCache(getCacheDir(self.scene, "textures"),
+                                   self.scene.bounty.gs_texture_cache_size * 1024 * 1024)
+
         # textures before materials
-        self.yaf_texture = exportTexture(self.yi)
+        self.yaf_texture = exportTexture(self.yi, assetCache)
+        self.yaf_texture.lodProxies = lodProxies
+        if self.session is not None:
+            self.yaf_texture.loadedTextures = self.session.loadedTextures
+            self.yaf_texture.imageFiles = self.session.imageFiles
+            self.yaf_texture.imageTextures = self.session.imageTextures
+            self.yaf_texture.textureAliases = self.session.textureAliases
              
         # and materials
-        self.setMaterial = TheBountyMaterialWrite(self.yi, self.materialMap, self.yaf_texture.loadedTextures)
+        self.setMaterial = TheBountyMaterialWrite(self.yi, self.materialMap, self.yaf_texture.loadedTextures,
+                                                  self.yaf_texture.textureAliases)
+        if self.session is not None:
+            self.setMaterial.sharedMaterials = self.session.sharedMaterials
+            self.setMaterial.canonicalNames = self.session.canonicalNames
+
+    def selectTextureProxies(self):
+        bounty = self.scene.bounty
+        # clay render uses no textures, the viewport renders from the 3D view,
+        # not the scene camera
+        if (bounty.gs_clay_render or not bounty.gs_texture_lod or not self.scene.camera or
+                self.is_preview or self.viewport is not None):
+            return {}
+        proxyCache = DiskCache(getCacheDir(self.scene, "proxies"), bounty.gs_texture_cache_size * 1024 * 1024)
+        return tby_texlod.selectProxies(self.scene, self.sceneIndex, proxyCache, self.yi)
 
     def exportScene(self):
-        #
-        for obj in self.scene.objects:
-            self.exportTexture(obj)
+        # create two basic material defination for use when any blend component are selected.
+        self.createDefaultBlends()
+
+        # clay render uses a single material, textures are never used
+        if not self.scene.bounty.gs_clay_render:
+            # not on viewport updates, and in a session only for the textures
+            # still to load
+            if self.scene.bounty.gs_texture_preflight and not self.is_preview and self.viewport is None:
+                self.yaf_texture.preflight = tby_preflight.preflightImages(self.sceneIndex, self.yi,
+                                                                           self.yaf_texture.loadedTextures)
+            for obj in self.sceneIndex.texturedObjects:
+                self.exportTexture(obj)
             
         self.exportMaterials()
         self.geometry.setScene(self.scene)
         self.exportObjects()
-        self.geometry.createCamera()
+        # after the objects, dupli source materials are written with them
+        if self.setMaterial.merged:
+            self.yi.printInfo("Exporter: {0} materials merged with identical ones".format(self.setMaterial.merged))
+        if self.geometry.meshCache is not None:
+            cache = self.geometry.meshCache
+            self.yi.printInfo("Exporter: Mesh cache, {0} meshes reused, {1} exported".format(cache.hits, cache.misses))
+        # the viewport adds cameras of its own
+        if self.scene.camera:
+            self.geometry.createCamera()
         self.environment.setEnvironment(self.scene)
 
+        if self.session is not None:
+            tracker = self.session.tracker
+            camera = self.scene.camera
+            if camera:
+                tracker.track('camera', camera.name, tby_session.dataFingerprint(camera.data, camera.matrix_world))
+            if self.scene.world:
+                tracker.track('world', self.scene.world.name, tby_session.dataFingerprint(self.scene.world))
+
     def exportTexture(self, obj):
-        # create two basic material defination for use when any blend component are selected.
-        self.createDefaultBlends()
-        
         # First export textures from blend materials
         for mat_slot in [m for m in obj.material_slots if m.material is not None]:
             #    
@@ -145,19 +242,13 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
                         continue
                     self.yaf_texture.writeTexture(self.scene, tex.texture)
 
-    def object_on_visible_layer(self, obj):
-        obj_visible = False
-        for layer_visible in [object_layers and scene_layers for object_layers, scene_layers in zip(obj.layers, self.scene.layers)]:
-            obj_visible |= layer_visible
-        return obj_visible
-
     def exportObjects(self):
         self.yi.printInfo("Exporter: Processing Lamps...")
 
         #---------------------------
         # export only visible lamps
         #---------------------------
-        for obj in [o for o in self.scene.objects if not o.hide_render and o.is_visible(self.scene) and o.type == 'LAMP']:
+        for obj in self.sceneIndex.lamps:
             if obj.is_duplicator:
                 obj.create_dupli_list(self.scene)
                 for obj_dupli in obj.dupli_list:
@@ -170,6 +261,8 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
                 if obj.parent and obj.parent.is_duplicator:
                     continue
                 self.lights.createLight(self.yi, obj, obj.matrix_world)
+                if self.session is not None:
+                    self.session.tracker.track('lamps', obj.name, tby_session.dataFingerprint(obj.data, obj.matrix_world))
 
         self.yi.printInfo("Exporter: Processing Geometry...")
 
@@ -178,31 +271,67 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
         #-----------------------------
         baseIds = {}
         dupBaseIds = {}
-
-        for obj in [o for o in self.scene.objects if not o.hide_render and (o.is_visible(self.scene) or o.hide) \
-        and self.object_on_visible_layer(o) and (o.type in {'MESH', 'SURFACE', 'CURVE', 'FONT', 'EMPTY'})]:
+        # instance transforms per base ID, submitted together after the loop
+        instances = {}
+
+        objects = self.sceneIndex.geometry
+
+        # copies of the same mesh (Shift+D) share one base mesh
+        autoInstanced = set()
+        if self.scene.bounty.gs_auto_instances and not self.is_preview and np is not None:
+            startTime = time.time()
+            for group in self.findIdenticalMeshes(objects):
+                oID = self.geometry.writeInstanceBase(group[0])
+                instances[oID] = (group[0].name, [o.matrix_world.copy() for o in group])
+                autoInstanced.update(group)
+            self.yi.printInfo("Exporter: Auto instancing, {0} objects share {1} base meshes ({2:.3f}s)".format(
+                              len(autoInstanced), len(instances), time.time() - startTime))
+
+        if self.session is not None:
+            for obj in objects:
+                self.session.tracker.track('objects', obj.name, tby_session.matrixFingerprint(obj.matrix_world))
+
+        for obj in objects:
             # Exporting dupliObjects as instances, also check for dupliObject type 'EMPTY' and don't export them as geometry
             if obj.is_duplicator:
                 self.yi.printInfo("Processing duplis for: {0}".format(obj.name))
+                startTime = time.time()
                 obj.dupli_list_create(self.scene)
 
+                # group the duplis by source object: textures, materials and the
+                # instance base are handled once per source, duplis only add a transform
+                sources = OrderedDict()
                 for obj_dupli in [od for od in obj.dupli_list if not od.object.type == 'EMPTY']:
-                    self.exportTexture(obj_dupli.object)
-                    for mat_slot in obj_dupli.object.material_slots:
-                        if mat_slot.material not in self.exportedMaterials: #materials:
-                            self.exportMaterial(mat_slot.material)
-
-                    if not self.scene.render.use_instances:
-                        matrix = obj_dupli.matrix.copy()
-                        self.geometry.writeMesh(obj_dupli.object, matrix)
-                    else:
-                        if obj_dupli.object.name not in dupBaseIds:
-                            dupBaseIds[obj_dupli.object.name] = self.geometry.writeInstanceBase(obj_dupli.object)
-                        matrix = obj_dupli.matrix.copy()
-                        self.geometry.writeInstance(dupBaseIds[obj_dupli.object.name], matrix, obj_dupli.object.name)
+                    sources.setdefault(obj_dupli.object, []).append(obj_dupli.matrix.copy())
 
                 if obj.dupli_list is not None:
                     obj.dupli_list_clear()
+                dupliTime = time.time() - startTime
+
+                startTime = time.time()
+                numDuplis = 0
+                for source, matrices in sources.items():
+                    if not self.scene.bounty.gs_clay_render:
+                        self.exportTexture(source)
+                        for mat_slot in source.material_slots:
+                            if mat_slot.material not in self.exportedMaterials: #materials:
+                                self.exportMaterial(mat_slot.material)
+
+                    if not self.scene.render.use_instances:
+                        for matrix in matrices:
+                            self.geometry.writeMesh(source, matrix)
+                    else:
+                        if source.name not in dupBaseIds:
+                            dupBaseIds[source.name] = self.geometry.writeInstanceBase(source)
+                            instances[dupBaseIds[source.name]] = (source.name, [])
+                        instances[dupBaseIds[source.name]][1].extend(matrices)
+                    numDuplis += len(matrices)
+                sourceTime = time.time() - startTime
+
+                if numDuplis:
+                    self.yi.printInfo("Exporter: {0} duplis of {1} sources, transforms {2:.3f}s ({3:.2f} us/dupli),"
+                                      " sources {4:.3f}s ({5:.1f} ms/source)".format(numDuplis, len(sources),
+                                      dupliTime, dupliTime * 1e6 / numDuplis, sourceTime, sourceTime * 1e3 / len(sources)))
 
                 # check if object has particle system and uses the option for 'render emitter'
                 if hasattr(obj, 'particle_systems'):
@@ -213,7 +342,7 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
                             self.geometry.writeMesh(obj, matrix)
 
             # no need to write empty object from here on, so continue with next object in loop
-            elif obj.type == 'EMPTY':
+            elif obj.type == 'EMPTY' or obj in autoInstanced:
                 continue
 
             # Exporting objects with shared mesh data blocks as instances
@@ -221,14 +350,43 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
                 self.yi.printInfo("Processing shared mesh data node object: {0}".format(obj.name))
                 if obj.data.name not in baseIds:
                     baseIds[obj.data.name] = self.geometry.writeInstanceBase(obj)
+                    instances[baseIds[obj.data.name]] = (obj.data.name, [])
 
                 if obj.name not in dupBaseIds:
-                    matrix = obj.matrix_world.copy()
-                    self.geometry.writeInstance(baseIds[obj.data.name], matrix, obj.data.name)
+                    instances[baseIds[obj.data.name]][1].append(obj.matrix_world.copy())
 
             elif obj.data.name not in baseIds and obj.name not in dupBaseIds:
                 self.geometry.writeObject(obj)
 
+        for oID in sorted(instances):
+            name, matrices = instances[oID]
+            if matrices:
+                self.geometry.writeInstances(oID, matrices, name)
+
+    def findIdenticalMeshes(self, objects):
+        """ Content hash pre-pass for automatic instancing. Returns groups of
+            objects with identical evaluated meshes and materials; only
+            objects that agree on cheap counts are evaluated and hashed.
+        """
+        candidates = OrderedDict()
+        for obj in objects:
+            if obj.type != 'MESH' or obj.is_duplicator or obj.particle_systems:
+                continue
+            if obj.bounty.geometry_type != 'geometry':
+                continue
+            if obj.data.users > 1 and self.scene.render.use_instances:
+                continue
+            key = (len(obj.data.vertices), len(obj.data.polygons), len(obj.material_slots),
+                   tuple(mod.type for mod in obj.modifiers if mod.show_render))
+            candidates.setdefault(key, []).append(obj)
+
+        groups = OrderedDict()
+        for objs in [c for c in candidates.values() if len(c) > 1]:
+            for obj in objs:
+                groups.setdefault(tby_geometry.meshContentHash(obj, self.scene), []).append(obj)
+
+        return [g for g in groups.values() if len(g) > 1]
+
     #
     def createDefaultBlends(self):
         #
@@ -290,23 +448,23 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
 
     def exportMaterials(self):
         self.yi.printInfo("Exporter: Processing Materials...")
-        self.exportedMaterials = set()
         
         #---------------------------------------------------
         # create shiny diffuse material for use by default
         # it will be assigned, if object has no material(s)
         #---------------------------------------------------
-        self.yi.paramsClearAll()
-        self.yi.paramsSetString("type", "shinydiffusemat")
-        self.yi.paramsSetColor("color", 0.8, 0.8, 0.8)
-        self.yi.printInfo("Exporter: Creating Material \"defaultMat\"")
-        ymat = self.yi.createMaterial("defaultMat")
-        self.materialMap["default"] = ymat
+        if "default" not in self.materialMap:
+            self.yi.paramsClearAll()
+            self.yi.paramsSetString("type", "shinydiffusemat")
+            self.yi.paramsSetColor("color", 0.8, 0.8, 0.8)
+            self.yi.printInfo("Exporter: Creating Material \"defaultMat\"")
+            ymat = self.yi.createMaterial("defaultMat")
+            self.materialMap["default"] = ymat
         #---------------------------------------------------
         # create a shinydiffuse material for "Clay Render"
         # exception: don't create for material preview mode
         #---------------------------------------------------
-        if not self.is_preview:
+        if not self.is_preview and "clay" not in self.materialMap:
             self.yi.paramsClearAll()
             self.yi.paramsSetString("type", "shinydiffusemat")
             cCol = self.scene.bounty.gs_clay_col
@@ -317,10 +475,10 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
         #----------------------------------------------
         # override all materials in 'clay render' mode
         #----------------------------------------------
-        for obj in [o for o in self.scene.objects if not self.scene.bounty.gs_clay_render]:
-            for mat_slot in obj.material_slots:
-                if mat_slot.material not in self.exportedMaterials:
-                    self.exportMaterial(mat_slot.material)
+        if not self.scene.bounty.gs_clay_render:
+            for mat in self.sceneIndex.materials:
+                if mat not in self.exportedMaterials:
+                    self.exportMaterial(mat)
 
     def exportMaterial(self, material):
         if material:
@@ -358,14 +516,76 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
         if not self.is_preview:
             scene.frame_set(scene.frame_current)
 
+            # exported while the previous frame rendered
+            prepared = tby_session.takePreparedFrame(scene.name, scene.frame_current)
+            if prepared is not None:
+                self.restoreFrameState(prepared.state)
+                self.yi.printInfo("Exporter: Frame {0} was exported during the previous render".format(prepared.frame))
+                return
+
+        self.exportFrame(scene)
+
+    def captureFrameState(self):
+        return dict((name, getattr(self, name, None)) for name in frameState)
+
+    def restoreFrameState(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def prepareNextFrame(self):
+        """ Exports the next animation frame into a second interface while the
+            current one renders. Returns True while more frames can be prepared.
+        """
+        scene = self.scene
+        queue = tby_session.preparedFrames
+        # only animation renders have a next frame, F12 renders do not
+        if self.is_preview or not self.is_animation or len(queue) >= scene.bounty.gs_anim_prefetch:
+            return False
+        # an export is not interrupted, never start one after an abort
+        if self.test_break():
+            return False
+        current = scene.frame_current
+        frame = (queue[-1].frame if queue else current) + scene.frame_step
+        if frame > scene.frame_end:
+            return False
+
+        tstart = time.time()
+        state = self.captureFrameState()
+        try:
+            scene.frame_set(frame)
+            # never the session interface, it is the one rendering
+            self.exportFrame(scene, allowSession=False)
+            queue.append(tby_session.PreparedFrame(scene.name, frame, self.captureFrameState()))
+        except:
+            # free what the failed export loaded into its own interface
+            if self.yi is not state['yi']:
+                self.yi.clearAll()
+            raise
+        finally:
+            self.restoreFrameState(state)
+            scene.frame_set(current)
+
+        self.yi.printInfo("Exporter: Frame {0} exported during render in {1:.3f}s ({2} ready)".format(
+                          frame, time.time() - tstart, len(queue)))
+        return True
+
+    def exportFrame(self, scene, allowSession=True):
         self.scene = scene
+        self.sceneIndex = SceneIndex(scene)
         render = scene.render
 
+        if allowSession and self.useSession(scene):
+            self.session = tby_session.getSession(self.is_preview)
+        else:
+            self.session = None
+            if allowSession:
+                tby_session.freeSessions()
+
         filePath = bpy.path.abspath(render.filepath)
         filePath = os.path.realpath(filePath)
         filePath = os.path.normpath(filePath)
 
-        [self.sizeX, self.sizeY, self.bStartX, self.bStartY, self.bsizeX, self.bsizeY, camDummy] = tby_scene.getRenderCoords(scene)
+        [self.sizeX, self.sizeY, self.bStartX, self.bStartY, self.bsizeX, self.bsizeY, camDummy] = tby_scene.getRenderCoords(scene, self.sceneIndex)
 
         if render.use_border:
             self.resX = self.bsizeX
@@ -375,19 +595,27 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
             self.resY = self.sizeY
         # render type setup
         if scene.bounty.gs_type_render == "file":
-            self.setInterface(yafrayinterface.yafrayInterface_t())
+            self.setInterface(self.newInterface())
             self.yi.setInputGamma(scene.bounty.gs_gamma_input, scene.bounty.sc_apply_gammaInput)
             self.outputFile, self.output, self.file_type = self.decideOutputFileName(filePath, scene.bounty.img_output)
-            self.yi.paramsClearAll()
-            self.yi.paramsSetString("type", self.file_type)
-            self.yi.paramsSetBool("alpha_channel", render.image_settings.color_mode == "RGBA")
-            self.yi.paramsSetBool("z_channel", scene.bounty.gs_z_channel)
-            self.yi.paramsSetInt("width", self.resX)
-            self.yi.paramsSetInt("height", self.resY)
-            self.ih = self.yi.createImageHandler("outFile")
-            self.co = yafrayinterface.imageOutput_t(self.ih, str(self.outputFile), 0, 0)
+            self.fileAlpha = render.image_settings.color_mode == "RGBA"
+            # rendered like 'into_blender', the file is written from the result buffers
+            depth = render.image_settings.color_depth
+            self.fileBits = int(depth) if depth.isdigit() else 8
+            self.fileInMemory = (scene.bounty.gs_file_in_memory and not self.is_preview and
+                                 tby_imageio.canWrite(self.file_type, self.fileBits))
+            if not self.fileInMemory:
+                self.yi.paramsClearAll()
+                self.yi.paramsSetString("type", self.file_type)
+                self.yi.paramsSetBool("alpha_channel", self.fileAlpha)
+                self.yi.paramsSetBool("z_channel", scene.bounty.gs_z_channel)
+                self.yi.paramsSetInt("width", self.resX)
+                self.yi.paramsSetInt("height", self.resY)
+                self.ih = self.yi.createImageHandler("outFile")
+                self.co = yafrayinterface.imageOutput_t(self.ih, str(self.outputFile), 0, 0)
 
         elif scene.bounty.gs_type_render == "xml":
+            self.fileInMemory = False
             self.setInterface(yafrayinterface.xmlInterface_t())
             self.yi.setInputGamma(scene.bounty.gs_gamma_input, scene.bounty.sc_apply_gammaInput)
             self.outputFile, self.output, self.file_type = self.decideOutputFileName(filePath, 'XML')
@@ -396,16 +624,99 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
             self.yi.setOutfile(self.outputFile)
 
         else:
-            self.setInterface(yafrayinterface.yafrayInterface_t())
+            self.fileInMemory = False
+            self.setInterface(self.newInterface())
             self.yi.setInputGamma(scene.bounty.gs_gamma_input, scene.bounty.sc_apply_gammaInput)
 
         self.yi.startScene()
         self.exportScene()# to above, line 92
-        self.lightIntegrator.exportIntegrator(self.scene.bounty) # lightIntegrator, line 26
+        self.lightIntegrator.exportIntegrator(self.scene.bounty, self.sceneIndex) # lightIntegrator, line 26
         self.lightIntegrator.exportVolumeIntegrator(self.scene)
+        if self.session is not None:
+            self.session.record(self.setMaterial.engineName)
+            self.session.tracker.report(self.yi)
 
         # must be called last as the params from here will be used by render()
-        tby_scene.exportRenderSettings(self.yi, self.scene)
+        tby_scene.exportRenderSettings(self.yi, self.scene, self.sceneIndex)
+
+    def __del__(self):
+        # leaving rendered shading: stop the view render and free its scene
+        if self.viewport is not None:
+            self.viewport.free()
+            self.viewport = None
+
+    def view_update(self, context):
+        # callback to export the scene for rendered viewport shading
+        if self.viewport is None:
+            self.viewport = tby_viewport.ViewportRender(self)
+        self.viewport.update(context)
+
+    def view_draw(self, context):
+        if self.viewport is not None:
+            self.viewport.draw(context)
+
+    def writeResultFiles(self, resultBuffer, zChannel):
+        # the frame is done, the image file(s) follow on a worker thread
+        self.yi.printInfo("Exporter: Writing {0} in the background".format(self.outputFile))
+        pixels = resultBuffer.rgba if self.fileAlpha else resultBuffer.rgba[..., :3]
+        files = [(self.outputFile, pixels)]
+        if zChannel:
+            depth = resultBuffer.depth
+            files.append(("{0}_zbuffer.{1}".format(self.output, self.file_type), depth / max(float(depth.max()), 1e-6)))
+        tby_imageio.writeImagesAsync(files, self.file_type, self.fileBits)
+
+    def superviseRender(self, target, args, idle=None):
+        """ Runs the engine render in a thread. The thread signals the end
+            itself, user breaks are checked on an interval that starts short
+            and grows while the render goes on. 'idle' is called while the
+            render runs until it returns False.
+        """
+        done = threading.Event()
+        finished = []
+
+        def renderThread():
+            try:
+                target(*args)
+            finally:
+                finished.append(time.time())
+                done.set()
+
+        thread = threading.Thread(target=renderThread)
+        tstart = time.time()
+        thread.start()
+
+        try:
+            interval = breakCheckMin
+            while not done.wait(interval):
+                if self.test_break():
+                    self.update_stats("", "Aborting...")
+                    self.yi.abort()
+                    break
+                if idle is not None:
+                    try:
+                        if not idle():
+                            idle = None
+                    except Exception as e:
+                        # the render goes on, only the idle work is given up
+                        self.yi.printError("Exporter: Work during render failed: {0}".format(e))
+                        import traceback
+                        traceback.print_exc()
+                        idle = None
+                interval = min(interval * 1.5, breakCheckMax)
+        except:
+            # never leave the engine rendering in the background
+            self.yi.abort()
+            raise
+        finally:
+            thread.join()
+
+        if finished:
+            # how late the end of the render was seen, and what a fixed 0.2s poll would give
+            elapsed = finished[0] - tstart
+            latency = time.time() - finished[0]
+            pollLatency = 0.2 - elapsed % 0.2
+            self.yi.printInfo("Exporter: Render thread {0:.3f}s, end seen after {1:.1f} ms "
+                              "(0.2s polling: {2:.1f} ms)".format(elapsed, latency * 1000, pollLatency * 1000))
 
     def render(self, scene):
         #--------------------------------------------
@@ -423,10 +734,10 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
         #
         self.bl_use_postprocess = False   
 
-        if scene.gs_type_render == "file" and not self.is_preview:
+        if scene.gs_type_render == "file" and not self.is_preview and not self.fileInMemory:
             self.yi.printInfo("Exporter: Rendering to file {0}".format(self.outputFile))
             
-            self.yi.render(self.co)
+            self.superviseRender(self.yi.render, (self.co,), self.prepareNextFrame)
             result = self.begin_result(0, 0, self.resX, self.resY)
             lay = result.layers[0]
 
@@ -447,18 +758,10 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
 
         else:# into blender
 
-            def progressCallback(command, *args):
-                if not self.test_break():
-                    if command == "tag":
-                        self.tag = args[0]
-                    elif command == "progress":
-                        self.prog = args[0]
-                    # test for add more into to 'tag'
-                    integrator = bpy.context.scene.bounty.intg_light_method
-                    self.update_stats("TheBounty Render: ", "{0}: {1}".format(integrator, self.tag))
-                    #
-                    self.update_progress(self.prog)
-                    
+            # integrator label read once, stats updates at a bounded rate
+            progress = ProgressReporter(self, bpy.context.scene.bounty.intg_light_method, scene.gs_progress_rate)
+            progressCallback = progress.progressCallback
+
             def drawAreaCallback(*args):
                 x, y, w, h, tile = args
                 result = self.begin_result(x, y, w, h)
@@ -486,28 +789,33 @@ class TheBountyRenderEngine(bpy.types.RenderEngine):
                     pass
 
                 self.end_result(result)
-                
-            # define thread
-            thread = threading.Thread(target=self.yi.render,
-                                 args=(self.resX, self.resY,
-                                       self.bStartX, self.bStartY,
-                                       self.is_preview,
-                                       drawAreaCallback,
-                                       flushCallback,
-                                       progressCallback)
-                                 )
-            # run..
-            thread.start()
-
-            while thread.isAlive() and not self.test_break():
-                time.sleep(0.2)
-
-            if thread.isAlive():
-                self.update_stats("", "Aborting...")
-                self.yi.abort()
-                thread.join()
-        #
-        self.yi.clearAll()
+
+            # tiles gathered in a float32 frame, the result refreshed at a bounded rate
+            resultBuffer = None
+            if np is not None:
+                resultBuffer = ResultBuffer(self, self.resX, self.resY)
+                drawAreaCallback = resultBuffer.drawAreaCallback
+                flushCallback = resultBuffer.flushCallback
+            drawAreaCallback = progress.countTiles(drawAreaCallback)
+
+            self.superviseRender(self.yi.render, (self.resX, self.resY,
+                                                  self.bStartX, self.bStartY,
+                                                  self.is_preview,
+                                                  drawAreaCallback,
+                                                  flushCallback,
+                                                  progressCallback),
+                                 self.prepareNextFrame)
+
+            if resultBuffer is not None:
+                resultBuffer.update(force=True)
+                resultBuffer.report(self.yi)
+                if self.fileInMemory and not self.test_break():
+                    self.writeResultFiles(resultBuffer, scene.gs_z_channel)
+            self.yi.printInfo("Exporter: {0} tiles, {1:.1f} tiles/s".format(progress.tiles,
+                              progress.tileRate(time.time())))
+        # a persistent session clears the engine before its next export
+        if self.session is None:
+            self.yi.clearAll()
         del self.yi
         self.update_stats("", "Done!")
         self.bl_use_postprocess = postprocess
@@ -0,0 +1,545 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+#---------------------------------------------------------------------
+# Array helpers for the bulk geometry path.
+#
+# Mesh data is read with 'foreach_get' into flat numpy buffers, quads
+# are split as whole arrays and the result is handed to the interface
+# in a few buffer sized calls:
+#
+#   yi.addVertices(co [, orco])           float32, 3 values per vertex
+#   yi.addUVs(uv)                         float32, 2 values per uv,
+#                                         returns index of the first uv
+#   yi.addTriangles(tri [, uvtri], mat)   int32, 3 indices per triangle
+#
+# Builds of the interface without those entry points (or a Blender
+# without numpy) use the per element path in tby_object.py.
+#---------------------------------------------------------------------
+
+import bpy
+import hashlib
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+bulkGeometryCalls = ('addVertices', 'addUVs', 'addTriangles')
+
+# hair strands go in batches between startCurveMesh and endCurveMesh:
+#
+#   yi.addStrands(points, offsets)        float32 points, 3 values each,
+#                                         int32 start of every strand
+#                                         plus the end of the last one
+bulkStrandCalls = ('addStrands',)
+strandsPerBatch = 65536
+
+# instances of a base mesh go in one call:
+#
+#   yi.addInstances(baseID, matrices)     float32, 16 values per instance
+bulkInstanceCalls = ('addInstances',)
+
+
+def hasCalls(yi, calls):
+    # interface calls newer than the engine builds in use are looked up
+    return all(hasattr(yi, call) for call in calls)
+
+
+def hasBulkGeometry(yi):
+    return np is not None and hasCalls(yi, bulkGeometryCalls)
+
+
+def hasBulkStrands(yi):
+    return np is not None and hasCalls(yi, bulkStrandCalls)
+
+
+def hasBulkInstances(yi):
+    return np is not None and hasCalls(yi, bulkInstanceCalls)
+
+
+def getMatrixArray(matrices):
+    return np.array(matrices, dtype=np.float32).reshape(-1, 16)
+
+
+def getVertexArray(mesh):
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    co.shape = (-1, 3)
+    return co
+
+
+def transformVertexArray(co, matrix):
+    # same result as mesh.transform(matrix), without touching the mesh
+    m = np.array(matrix, dtype=np.float64)
+    out = co.dot(m[:3, :3].T) + m[:3, 3]
+    return out.astype(np.float32)
+
+
+def placeTriMeshArrays(arrays, matrix):
+    # object space arrays moved to where 'matrix' puts them
+    if matrix is None:
+        return arrays
+    placed = dict(arrays)
+    placed['co'] = transformVertexArray(arrays['co'], matrix)
+    return placed
+
+
+def getOrcoArray(co):
+    """ Untransformed vertices brought into a (-1 -1 -1) (1 1 1) box,
+        with the bounds taken from the vertex array itself.
+    """
+    bbMin = co.min(axis=0)
+    delta = co.max(axis=0) - bbMin
+    delta[delta < 0.0001] = 1
+    return np.ascontiguousarray(2 * (co - bbMin) / delta - 1, dtype=np.float32)
+
+
+def getOrcoList(coords):
+    # same as getOrcoArray, for Blender builds without numpy
+    axes = list(zip(*coords))
+    bbMin = [min(a) for a in axes]
+    delta = [max(a) - lo for a, lo in zip(axes, bbMin)]
+    delta = [d if d >= 0.0001 else 1 for d in delta]
+    return [[2 * (c - lo) / d - 1 for c, lo, d in zip(co, bbMin, delta)] for co in coords]
+
+
+def getFaceArrays(mesh):
+    faces = mesh.tessfaces
+    nFaces = len(faces)
+
+    verts = np.empty(nFaces * 4, dtype=np.int32)
+    faces.foreach_get("vertices_raw", verts)
+    verts.shape = (nFaces, 4)
+
+    matIndex = np.empty(nFaces, dtype=np.int32)
+    faces.foreach_get("material_index", matIndex)
+
+    smooth = np.empty(nFaces, dtype=np.bool_)
+    faces.foreach_get("use_smooth", smooth)
+
+    return verts, matIndex, smooth
+
+
+def getFaceUVArray(uvLayer, nFaces):
+    uv = np.empty(nFaces * 8, dtype=np.float32)
+    uvLayer.data.foreach_get("uv_raw", uv)
+    uv.shape = (nFaces, 4, 2)
+    return uv
+
+
+def getQuadMask(verts):
+    # tessellated faces store triangles with a zero fourth index
+    return verts[:, 3] != 0
+
+
+def triangulate(verts, isQuad):
+    """ Split faces into triangles (0, 1, 2) and, for quads, (0, 2, 3).
+        Returns the triangle indices and the face index of every triangle.
+    """
+    quads = verts[isQuad]
+    tris = np.concatenate((verts[:, (0, 1, 2)], quads[:, (0, 2, 3)]))
+    triFace = np.concatenate((np.arange(len(verts), dtype=np.int32),
+                              np.nonzero(isQuad)[0].astype(np.int32)))
+    return np.ascontiguousarray(tris, dtype=np.int32), triFace
+
+
+def triangulateFaceUVs(uv, isQuad):
+    """ Emit the used corners of every face once, like the per element
+        path does, and return them with the per triangle uv indices.
+    """
+    nFaces = len(uv)
+    used = np.ones((nFaces, 4), dtype=np.bool_)
+    used[:, 3] = isQuad
+
+    corners = np.ascontiguousarray(uv[used], dtype=np.float32)
+    cornerIndex = (np.cumsum(used.ravel()) - 1).astype(np.int32)
+    cornerIndex.shape = (nFaces, 4)
+
+    uvTris = np.concatenate((cornerIndex[:, (0, 1, 2)], cornerIndex[isQuad][:, (0, 2, 3)]))
+    return corners, np.ascontiguousarray(uvTris, dtype=np.int32)
+
+
+def gatherMaterials(matTable, matIndex):
+    """ Apply a per object material table to the material index array.
+        Returns the distinct engine materials and, for every triangle,
+        the position of its material in that list.
+    """
+    ymaterials = []
+    lut = np.empty(len(matTable), dtype=np.int32)
+    for i, ymat in enumerate(matTable):
+        for group, used in enumerate(ymaterials):
+            if used is ymat:
+                lut[i] = group
+                break
+        else:
+            lut[i] = len(ymaterials)
+            ymaterials.append(ymat)
+
+    return ymaterials, lut[np.clip(matIndex, 0, len(matTable) - 1)]
+
+
+# the engine keeps each uv as two floats
+uvSize = 8
+
+
+def weldUVs(uv, uvTris):
+    """ Merge identical uv values. Returns the unique uvs and the per
+        triangle uv indices remapped to them.
+    """
+    # '+ 0.0' folds -0.0 into 0.0 before comparing the raw bits
+    keys = np.ascontiguousarray(uv + 0.0, dtype=np.float32).view(np.uint64).ravel()
+    unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return np.ascontiguousarray(uv[first]), np.ascontiguousarray(inverse.astype(np.int32)[uvTris])
+
+
+def printUVWeld(yi, name, corners, unique):
+    saved = (corners - unique) * uvSize
+    yi.printInfo("Exporter: {0}: {1} unique UVs from {2} face corners, {3:.1f} KB saved".format(
+                 name, unique, corners, saved / 1024.0))
+
+
+#---------------------------------------------------------------------
+# Strand level of detail: points are dropped while the strand stays
+# within a projected pixel error from the active camera, and hair far
+# from the camera is thinned out.
+#---------------------------------------------------------------------
+
+class cameraView(object):
+    def __init__(self, scene):
+        camera = scene.camera
+        cam = camera.data
+        render = scene.render
+        matrix = np.array(camera.matrix_world, dtype=np.float32)
+
+        self.position = matrix[:3, 3]
+        self.direction = -matrix[:3, 2] / np.linalg.norm(matrix[:3, 2])
+
+        x = int(render.resolution_x * render.resolution_percentage * 0.01)
+        y = int(render.resolution_y * render.resolution_percentage * 0.01)
+
+        # size of one pixel at distance 1 (perspective) or anywhere (orthographic)
+        self.orthographic = cam.bounty.camera_type == "orthographic"
+        if self.orthographic:
+            self.pixelSize = cam.ortho_scale / max(x, y)
+        else:
+            if cam.sensor_fit == 'AUTO':
+                sensorPixels = max(x, y)
+                sensorSize = cam.sensor_width
+            elif cam.sensor_fit == 'HORIZONTAL':
+                sensorPixels = x
+                sensorSize = cam.sensor_width
+            else:
+                sensorPixels = y
+                sensorSize = cam.sensor_height
+            self.pixelSize = sensorSize / (cam.lens * sensorPixels)
+
+    def depth(self, points):
+        return np.maximum((points - self.position).dot(self.direction), 1e-4)
+
+    def tolerance(self, points, pixels):
+        # world space size of 'pixels' pixels at the given points
+        if self.orthographic:
+            return np.full(len(points), pixels * self.pixelSize)
+        return pixels * self.pixelSize * self.depth(points)
+
+
+def simplifyPolyline(points, tolerance):
+    """ Douglas-Peucker: mask of the points to keep so that no dropped
+        point is further than 'tolerance' from the simplified strand.
+    """
+    n = len(points)
+    keep = np.zeros(n, dtype=np.bool_)
+    keep[0] = keep[-1] = True
+    tol2 = tolerance * tolerance
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        seg = points[j] - points[i]
+        rel = points[i + 1:j] - points[i]
+        length2 = seg.dot(seg)
+        if length2 > 0:
+            t = np.clip(rel.dot(seg) / length2, 0.0, 1.0)
+            rel = rel - np.outer(t, seg)
+        dist2 = np.einsum('ij,ij->i', rel, rel)
+        k = int(np.argmax(dist2))
+        if dist2[k] > tol2:
+            k += i + 1
+            keep[k] = True
+            stack.append((i, k))
+            stack.append((k, j))
+    return keep
+
+
+def thinStrands(roots, view, thinDistance, minDensity):
+    """ Indices of the strands to keep, decided from their root points
+        before any step is sampled. Strands beyond 'thinDistance' are kept
+        with a density falling with the squared distance, never below
+        'minDensity'.
+    """
+    numStrands = len(roots)
+    if thinDistance <= 0 or not numStrands:
+        return np.arange(numStrands)
+    dist = np.linalg.norm(roots - view.position, axis=1)
+    density = np.ones(numStrands, dtype=np.float32)
+    far = dist > thinDistance
+    density[far] = np.maximum((thinDistance / dist[far]) ** 2, minDensity)
+    # golden ratio sequence, so the kept strands are spread evenly
+    spread = np.modf(np.arange(numStrands, dtype=np.float32) * np.float32(0.6180339887498949))[0]
+    return np.nonzero(spread < density)[0]
+
+
+def simplifyStrands(points, offsets, view, pixelError):
+    """ Returns the reduced float32 point and int32 offset arrays. """
+    outPoints = np.empty_like(points)
+    outOffsets = np.empty_like(offsets)
+    outOffsets[0] = numPoints = 0
+    for strand in range(0, len(offsets) - 1):
+        strandPoints = points[offsets[strand]:offsets[strand + 1]]
+        if len(strandPoints) > 2 and pixelError > 0:
+            tolerance = view.tolerance(strandPoints, pixelError).min()
+            strandPoints = strandPoints[simplifyPolyline(strandPoints, tolerance)]
+        outPoints[numPoints:numPoints + len(strandPoints)] = strandPoints
+        numPoints += len(strandPoints)
+        outOffsets[strand + 1] = numPoints
+
+    return outPoints[:numPoints], outOffsets
+
+
+#---------------------------------------------------------------------
+# Mesh cache support: triangulated arrays are stored in '.npz' files,
+# keyed by a fingerprint of everything the evaluated mesh depends on.
+#---------------------------------------------------------------------
+
+meshCacheVersion = 3
+
+triMeshArrayNames = ('co', 'orco', 'tris', 'uv', 'uvTris', 'triMat', 'smooth', 'smoothAngle')
+
+# modifiers whose result changes with the frame, even with unchanged settings
+timeDependentModifiers = {
+    'BUILD', 'CLOTH', 'COLLISION', 'DYNAMIC_PAINT', 'EXPLODE', 'FLUID_SIMULATION',
+    'MESH_CACHE', 'OCEAN', 'PARTICLE_INSTANCE', 'PARTICLE_SYSTEM', 'SMOKE',
+    'SOFT_BODY', 'WAVE',
+}
+
+
+def hashArray(h, collection, attr, count, dtype):
+    data = np.empty(len(collection) * count, dtype=dtype)
+    collection.foreach_get(attr, data)
+    h.update(data.tobytes())
+
+
+def hashMatrix(h, matrix):
+    h.update(np.array(matrix, dtype=np.float64).tobytes())
+
+
+def readsVertexGroups(ob):
+    # armature and mask modifiers read groups by bone name, the others
+    # (displace, smooth, weight edit...) only the group they are given
+    for mod in ob.modifiers:
+        if not mod.show_render:
+            continue
+        if mod.type == 'MASK' or (mod.type == 'ARMATURE' and mod.use_vertex_groups):
+            return True
+        for prop in mod.bl_rna.properties:
+            if prop.type == 'STRING' and prop.identifier.startswith("vertex_group") and getattr(mod, prop.identifier):
+                return True
+    return False
+
+
+def hashVertexGroups(h, ob):
+    # weights only matter to the render modifiers reading them
+    if not ob.vertex_groups or ob.type != 'MESH' or not readsVertexGroups(ob):
+        return
+    h.update(repr([group.name for group in ob.vertex_groups]).encode())
+    weights = [(v.index, g.group, g.weight) for v in ob.data.vertices for g in v.groups]
+    h.update(np.array(weights, dtype=np.float64).tobytes())
+
+
+def hashCurveData(h, cu):
+    for spline in cu.splines:
+        hashProperties(h, spline, 0)
+        hashArray(h, spline.bezier_points, "co", 3, np.float32)
+        hashArray(h, spline.bezier_points, "handle_left", 3, np.float32)
+        hashArray(h, spline.bezier_points, "handle_right", 3, np.float32)
+        hashArray(h, spline.points, "co", 4, np.float32)
+
+
+def hashImageData(h, img):
+    h.update(repr((img.filepath, img.source, img.generated_type, img.generated_width,
+                   img.generated_height, img.packed_file.size if img.packed_file else None)).encode())
+    try:
+        h.update(repr(os.path.getmtime(bpy.path.abspath(img.filepath, library=img.library))).encode())
+    except OSError:
+        pass
+
+
+def hashIDData(h, data, seen):
+    # contents of a data block read by a modifier (target mesh, curve,
+    # lattice, displace texture...), each block once
+    h.update(data.name.encode())
+    if data in seen:
+        return
+    seen.add(data)
+    if isinstance(data, bpy.types.Mesh):
+        hashMeshData(h, data)
+    elif isinstance(data, bpy.types.Lattice):
+        hashArray(h, data.points, "co_deform", 3, np.float32)
+        hashProperties(h, data, 1, seen)
+    elif isinstance(data, bpy.types.Curve):
+        hashCurveData(h, data)
+        hashProperties(h, data, 1, seen)
+    elif isinstance(data, bpy.types.Image):
+        hashImageData(h, data)
+    else:
+        hashProperties(h, data, 1, seen)
+
+
+def hashObjectState(h, ob, seen=None):
+    # state of an object used by a modifier (armature, hook, mirror, ...),
+    # with 'seen' also its evaluated data: own data, weights and modifiers
+    h.update(ob.name.encode())
+    hashMatrix(h, ob.matrix_world)
+    if ob.type == 'ARMATURE' and ob.pose:
+        for bone in ob.pose.bones:
+            hashMatrix(h, bone.matrix)
+    if seen is None or ob in seen:
+        return
+    seen.add(ob)
+    if ob.data is not None:
+        hashIDData(h, ob.data, seen)
+    hashVertexGroups(h, ob)
+    hashModifiers(h, ob, seen)
+
+
+# data block bookkeeping, changes without changing the exported result
+volatileProperties = {'rna_type', 'users', 'use_fake_user', 'tag', 'is_updated', 'is_updated_data',
+                      'is_library_indirect', 'preview'}
+
+
+def hashProperties(h, struct, depth=2, seen=None):
+    """ Hashes the RNA properties of 'struct'. Data blocks it points to are
+        hashed by name, or by content when a 'seen' set is given.
+    """
+    for prop in struct.bl_rna.properties:
+        ident = prop.identifier
+        if ident in volatileProperties or prop.type == 'COLLECTION':
+            continue
+        value = getattr(struct, ident, None)
+        h.update(ident.encode())
+        if prop.type == 'POINTER':
+            if value is None:
+                continue
+            if isinstance(value, bpy.types.Object):
+                hashObjectState(h, value, seen)
+            elif isinstance(value, bpy.types.ID):
+                if seen is None:
+                    h.update(value.name.encode())
+                else:
+                    hashIDData(h, value, seen)
+            elif depth > 0:
+                hashProperties(h, value, depth - 1, seen)
+        elif getattr(prop, "is_array", False):
+            h.update(repr(tuple(value)).encode())
+        elif isinstance(value, set):
+            # enum flags, keep the order stable
+            h.update(repr(sorted(value)).encode())
+        else:
+            h.update(repr(value).encode())
+
+
+def hashMeshData(h, me):
+    hashArray(h, me.vertices, "co", 3, np.float32)
+    hashArray(h, me.edges, "vertices", 2, np.int32)
+    hashArray(h, me.edges, "use_edge_sharp", 1, np.bool_)
+    hashArray(h, me.edges, "crease", 1, np.float32)
+    hashArray(h, me.loops, "vertex_index", 1, np.int32)
+    hashArray(h, me.polygons, "loop_total", 1, np.int32)
+    hashArray(h, me.polygons, "material_index", 1, np.int32)
+    hashArray(h, me.polygons, "use_smooth", 1, np.bool_)
+    for layer in me.uv_layers:
+        h.update(layer.name.encode())
+        hashArray(h, layer.data, "uv", 2, np.float32)
+    h.update(repr((me.use_auto_smooth, me.auto_smooth_angle, me.uv_textures.active_index)).encode())
+    if me.shape_keys:
+        for key in me.shape_keys.key_blocks:
+            h.update(repr((key.name, key.value, key.mute)).encode())
+            hashArray(h, key.data, "co", 3, np.float32)
+
+
+def hashModifiers(h, ob, seen):
+    for mod in ob.modifiers:
+        if mod.show_render:
+            h.update(mod.type.encode())
+            hashProperties(h, mod, 2, seen)
+
+
+def meshFingerprint(obj, scene, flags):
+    """ Hash of the object's mesh data block and vertex weights, and the
+        settings of its render modifiers with the content of the data they
+        read. Its digest keys the session arrays kept in object space,
+        'placedMeshKey' adds the matrix for the mesh cache.
+    """
+    h = hashlib.sha1()
+    h.update(repr((meshCacheVersion, obj.type, flags)).encode())
+    if any(mod.show_render and mod.type in timeDependentModifiers for mod in obj.modifiers):
+        h.update(repr(scene.frame_current).encode())
+    hashMeshData(h, obj.data)
+    hashVertexGroups(h, obj)
+    hashModifiers(h, obj, set([obj, obj.data]))
+    return h
+
+
+def placedMeshKey(fingerprint, matrix):
+    # key for the mesh cache: the vertices are stored baked with 'matrix'
+    h = fingerprint.copy()
+    hashMatrix(h, matrix)
+    return h.hexdigest()
+
+
+def meshContentHash(obj, scene):
+    """ Key for automatic instancing: the evaluated render mesh in object
+        space and the materials of the object slots.
+    """
+    h = hashlib.sha1()
+    h.update(repr((obj.type, [s.material.name if s.material else "" for s in obj.material_slots])).encode())
+    mesh = obj.to_mesh(scene, True, 'RENDER')
+    try:
+        hashMeshData(h, mesh)
+    finally:
+        bpy.data.meshes.remove(mesh)
+    return h.hexdigest()
+
+
+def saveTriMeshArrays(path, arrays):
+    with open(path, 'wb') as f:
+        np.savez(f, **dict((k, v) for k, v in arrays.items() if v is not None))
+
+
+def loadTriMeshArrays(path):
+    try:
+        with np.load(path) as data:
+            return dict((k, data[k] if k in data.files else None) for k in triMeshArrayNames)
+    except (OSError, IOError, ValueError) as e:
+        print("Exporter: Unable to read mesh cache file {0}: {1}".format(path, e))
+        return None
@@ -0,0 +1,325 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+import os
+import struct
+import threading
+import time
+import zlib
+from .tby_geometry import np
+
+# Image files written from the render buffers, without Blender. Buffers are
+# float32 (height, width, channels) arrays with the bottom row first, as the
+# Blender render result keeps them.
+
+
+def toBytes(pixels):
+    return (np.clip(pixels, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+
+def toWords(pixels):
+    # 16 bit big endian, as PNG stores them
+    return (np.clip(pixels, 0.0, 1.0) * 65535.0 + 0.5).astype(">u2")
+
+
+def writePNG(path, pixels, bits=8):
+    height, width, channels = pixels.shape
+    colorType = {1: 0, 3: 2, 4: 6}[channels]
+    data = toWords(pixels[::-1]) if bits == 16 else toBytes(pixels[::-1])
+    rows = data.reshape(height, -1).view(np.uint8)
+    # filter type 0 in front of every row
+    raw = np.hstack((np.zeros((height, 1), dtype=np.uint8), rows)).tobytes()
+
+    def chunk(tag, data):
+        return (struct.pack(">I", len(data)) + tag + data +
+                struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff))
+
+    with open(path, 'wb') as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, bits, colorType, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw, 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+def writeTGA(path, pixels, bits=8):
+    # uncompressed true color or grayscale, bottom row first like the buffer
+    height, width, channels = pixels.shape
+    data = toBytes(pixels)
+    if channels >= 3:
+        data = data[..., [2, 1, 0, 3][:channels]]
+    imageType = 3 if channels == 1 else 2
+    descriptor = 8 if channels == 4 else 0
+    with open(path, 'wb') as f:
+        f.write(struct.pack("<BBBHHBHHHHBB", 0, 0, imageType, 0, 0, 0, 0, 0,
+                            width, height, channels * 8, descriptor))
+        f.write(np.ascontiguousarray(data).tobytes())
+
+
+def writeHDR(path, pixels, bits=32):
+    # Radiance RGBE, flat scanlines, top row first
+    height, width = pixels.shape[:2]
+    rgb = pixels[::-1, :, :3].astype(np.float64)
+    if pixels.shape[2] == 1:
+        rgb = np.repeat(pixels[::-1].astype(np.float64), 3, axis=2)
+    peak = rgb.max(axis=2)
+    mantissa, exponent = np.frexp(peak)
+    scale = np.where(peak > 1e-32, mantissa * 256.0 / np.where(peak > 1e-32, peak, 1.0), 0.0)
+    rgbe = np.zeros((height, width, 4), dtype=np.uint8)
+    rgbe[..., :3] = np.clip(rgb * scale[..., None], 0, 255).astype(np.uint8)
+    rgbe[..., 3] = np.where(peak > 1e-32, exponent + 128, 0).astype(np.uint8)
+    with open(path, 'wb') as f:
+        f.write("#?RADIANCE\nFORMAT=32-bit_rle_rgbe\n\n-Y {0} +X {1}\n".format(height, width).encode())
+        f.write(rgbe.tobytes())
+
+
+writers = {
+    'png': writePNG,
+    'tga': writeTGA,
+    'hdr': writeHDR,
+}
+
+# bits per channel each writer supports, None for float files
+writerBits = {
+    'png': (8, 16),
+    'tga': (8,),
+    'hdr': None,
+}
+
+
+def canWrite(filetype, bits=8):
+    if np is None or filetype not in writers:
+        return False
+    return writerBits[filetype] is None or bits in writerBits[filetype]
+
+
+def writeImage(path, pixels, filetype, bits=8):
+    # written next to the target and moved in place when complete
+    temp = "{0}.{1}.tmp".format(path, os.getpid())
+    if writerBits[filetype] is None:
+        writers[filetype](temp, pixels)
+    else:
+        writers[filetype](temp, pixels, bits)
+    os.replace(temp, path)
+
+
+# (thread, paths) of the writes still running, waited for at the end of the
+# render job and before the same files are written again
+pendingWrites = []
+
+
+def writeImagesAsync(files, filetype, bits=8):
+    """ files: list of (path, pixels). Returns the writer thread. """
+    paths = set(path for path, pixels in files)
+    for thread, written in pendingWrites:
+        if written & paths:
+            thread.join()
+
+    def run():
+        tstart = time.time()
+        for path, pixels in files:
+            try:
+                writeImage(path, pixels, filetype, bits)
+            except (OSError, IOError) as e:
+                print("Exporter: Unable to write image {0}: {1}".format(path, e))
+        print("Exporter: Image file(s) written in {0:.3f}s: {1}".format(
+              time.time() - tstart, ", ".join(path for path, pixels in files)))
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    pendingWrites[:] = [(t, p) for t, p in pendingWrites if t.is_alive()]
+    pendingWrites.append((thread, paths))
+    return thread
+
+
+def waitForWrites():
+    for thread, paths in pendingWrites:
+        thread.join()
+    del pendingWrites[:]
+
+
+# Image headers: size, channels and bits per channel read without decoding
+# the pixels. The readers get the open file and its first bytes.
+
+
+def pngHeader(f, head):
+    if head[:8] != b"\x89PNG\r\n\x1a\n" or head[12:16] != b"IHDR":
+        return None
+    width, height, depth, colorType = struct.unpack(">IIBB", head[16:26])
+    channels = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}.get(colorType, 4)
+    return width, height, channels, depth
+
+
+def jpegHeader(f, head):
+    if head[:2] != b"\xff\xd8":
+        return None
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xff:
+            return None
+        code = marker[1]
+        if code == 0xff:
+            # fill byte
+            f.seek(-1, 1)
+            continue
+        size = struct.unpack(">H", f.read(2))[0]
+        # start of frame markers, all but DHT, JPG and DAC
+        if 0xc0 <= code <= 0xcf and code not in (0xc4, 0xc8, 0xcc):
+            depth, height, width, channels = struct.unpack(">BHHB", f.read(6))
+            return width, height, channels, depth
+        f.seek(size - 2, 1)
+
+
+def tgaHeader(f, head):
+    imageType = head[2]
+    if len(head) < 18 or imageType not in (1, 2, 3, 9, 10, 11):
+        return None
+    width, height, bits = struct.unpack("<HHB", head[12:17])
+    if imageType in (1, 9):
+        # color mapped
+        return width, height, 3, 8
+    return width, height, max(bits // 8, 1), 8
+
+
+def bmpHeader(f, head):
+    if head[:2] != b"BM":
+        return None
+    width, height = struct.unpack("<ii", head[18:26])
+    bits = struct.unpack("<H", head[28:30])[0]
+    return width, abs(height), 4 if bits == 32 else 3, 8
+
+
+def hdrHeader(f, head):
+    if not head.startswith(b"#?"):
+        return None
+    f.seek(0)
+    for line in f:
+        line = line.strip()
+        # the resolution line follows the blank line ending the header
+        if line[:2] in (b"-Y", b"+Y"):
+            parts = line.split()
+            return int(parts[3]), int(parts[1]), 3, 32
+    return None
+
+
+def exrHeader(f, head):
+    if head[:4] != b"\x76\x2f\x31\x01":
+        return None
+    f.seek(8)
+
+    def readString():
+        chars = bytearray()
+        while True:
+            c = f.read(1)
+            if not c or c == b"\0":
+                return bytes(chars)
+            chars += c
+
+    width = height = None
+    channels = 0
+    depth = 16
+    while True:
+        name = readString()
+        if not name:
+            break
+        readString()
+        size = struct.unpack("<i", f.read(4))[0]
+        data = f.read(size)
+        if name == b"dataWindow":
+            xmin, ymin, xmax, ymax = struct.unpack("<iiii", data[:16])
+            width, height = xmax - xmin + 1, ymax - ymin + 1
+        elif name == b"channels":
+            # name, pixel type, linear flag, reserved and sampling per channel
+            pos = 0
+            while pos < len(data) and data[pos] != 0:
+                pos = data.index(b"\0", pos) + 1
+                pixelType = struct.unpack("<i", data[pos:pos + 4])[0]
+                depth = max(depth, 16 if pixelType == 1 else 32)
+                channels += 1
+                pos += 16
+    if width is None:
+        return None
+    return width, height, channels, depth
+
+
+def tiffHeader(f, head):
+    if head[:4] == b"II*\0":
+        order = "<"
+    elif head[:4] == b"MM\0*":
+        order = ">"
+    else:
+        return None
+    f.seek(struct.unpack(order + "I", head[4:8])[0])
+    count = struct.unpack(order + "H", f.read(2))[0]
+    tags = {}
+    for i in range(count):
+        tag, kind, number, value = struct.unpack(order + "HHI4s", f.read(12))
+        if kind == 3:
+            # SHORT values are left justified in the field
+            value = struct.unpack(order + "H", value[:2])[0]
+        else:
+            value = struct.unpack(order + "I", value)[0]
+        tags[tag] = (value, number)
+    if 256 not in tags or 257 not in tags:
+        return None
+    channels = tags.get(277, (1, 1))[0]
+    depth = tags.get(258, (8, 1))
+    # several bits per sample values are stored elsewhere, they are all alike
+    depth = depth[0] if depth[1] <= 2 else 8
+    return tags[256][0], tags[257][0], channels, depth
+
+
+headerReaders = {
+    '.png': pngHeader,
+    '.jpg': jpegHeader,
+    '.jpeg': jpegHeader,
+    '.tga': tgaHeader,
+    '.bmp': bmpHeader,
+    '.hdr': hdrHeader,
+    '.exr': exrHeader,
+    '.tif': tiffHeader,
+    '.tiff': tiffHeader,
+}
+
+
+def readImageHeader(path):
+    """ (width, height, channels, bits per channel) of an image file, read
+        from its header. None for unknown or unreadable files.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    readers = [headerReaders[ext]] if ext in headerReaders else []
+    # the extension may lie, try the formats with a signature after it
+    for reader in headerReaders.values():
+        if reader not in readers and reader is not tgaHeader:
+            readers.append(reader)
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(32)
+            for reader in readers:
+                f.seek(0)
+                try:
+                    header = reader(f, head)
+                except (struct.error, ValueError, IndexError):
+                    header = None
+                if header is not None:
+                    return header
+    except (OSError, IOError):
+        pass
+    return None
@@ -29,7 +29,7 @@ switchDebugType = {
     'dSdU': 6,
     'dSdV': 7,
 }
-def haveLights():
+def haveLights(sceneIndex=None):
     scene = bpy.context.scene
     world = scene.world.bounty
     
@@ -41,6 +41,9 @@ def haveLights():
         return True
 
     # check for lamp, meshlight or portal light object in scene
+    if sceneIndex is not None:
+        return sceneIndex.hasLights()
+
     for sceneObj in scene.objects:
         if not sceneObj.hide_render and sceneObj.is_visible(scene):
             if sceneObj.type == "LAMP" or sceneObj.bounty.geometry_type in {'mesh_light', 'portal_light'}:
@@ -62,7 +65,7 @@ class exportIntegrator:
         self.yi = interface
         self.preview = preview
 
-    def exportIntegrator(self, scene):
+    def exportIntegrator(self, scene, sceneIndex=None):
         yi = self.yi
 
         yi.paramsClearAll()
@@ -79,12 +82,17 @@ class exportIntegrator:
         yi.paramsSetBool("transpShad", scene.gs_transp_shad)
 
         lightIntegrator = scene.intg_light_method
+        # cheaper lighting profile for clay previews
+        clayFast = scene.gs_clay_render and scene.gs_clay_fast_lighting
+        if clayFast:
+            lightIntegrator = "directlighting"
         yi.printInfo("Exporting Integrator: {0}".format(lightIntegrator))
 
         if lightIntegrator == "directlighting":
-            yi.paramsSetBool("caustics", scene.intg_use_caustics)
+            useCaustics = scene.intg_use_caustics and not clayFast
+            yi.paramsSetBool("caustics", useCaustics)
 
-            if scene.intg_use_caustics:
+            if useCaustics:
                 yi.paramsSetInt("photons", scene.intg_photons)
                 yi.paramsSetInt("caustic_mix", scene.intg_caustic_mix)
                 yi.paramsSetInt("caustic_depth", scene.intg_caustic_depth)
@@ -129,7 +137,7 @@ class exportIntegrator:
 
         elif lightIntegrator == "bidirectional":
             yi.paramsSetBool("do_LightImage", scene.intg_do_lightImage)
-            if not haveLights():
+            if not haveLights(sceneIndex):
                 yi.printWarning('Bidirectional Integrator need a lights on scene for work')
                 return False
 
@@ -153,7 +161,8 @@ class exportIntegrator:
         #----------------------------------
         # Sub-Surface Scattering integrator
         #----------------------------------
-        if lightIntegrator in {'directlighting', 'photonmapping', 'pathtracing'} and haveSSS():
+        # no translucent materials are exported in clay render
+        if lightIntegrator in {'directlighting', 'photonmapping', 'pathtracing'} and not scene.gs_clay_render and haveSSS():
             yi.paramsSetBool("useSSS", scene.intg_useSSS)
             if scene.intg_useSSS:
                 yi.paramsSetInt("sssPhotons", scene.intg_sssPhotons)
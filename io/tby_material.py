@@ -19,7 +19,9 @@
 # <pep8 compliant>
 
 import bpy
+import hashlib
 import yafrayinterface
+from .tby_viewport import ParamRecorder
 
 
 def proj2int(val):
@@ -64,16 +66,56 @@ switchMappingCoords = {
     'SPHERE': 'sphere',
 }
 
+
+class MaterialRecorder(ParamRecorder):
+    """ Stands in for the interface while a material is written. The params
+        calls are recorded and hashed, and only replayed for a material
+        that was not created already.
+    """
+    def paramsSetMemMatrix(self, name, matrix, transpose):
+        # the array is freed by the caller, keep the values
+        values = tuple(yafrayinterface.floatArray_getitem(matrix, i) for i in range(16))
+        self.calls.append(("paramsSetMemMatrix", (name, values, transpose)))
+
+    def createMaterial(self, name):
+        return None
+
+    def key(self):
+        return hashlib.sha1(repr(self.calls).encode()).hexdigest()
+
+    def replayCall(self, yi, name, args):
+        if name != "paramsSetMemMatrix":
+            return ParamRecorder.replayCall(self, yi, name, args)
+        param, values, transpose = args
+        matrix = yafrayinterface.new_floatArray(16)
+        for i, v in enumerate(values):
+            yafrayinterface.floatArray_setitem(matrix, i, v)
+        yi.paramsSetMemMatrix(param, matrix, transpose)
+        yafrayinterface.delete_floatArray(matrix)
+
+
 class TheBountyMaterialWrite:
-    def __init__(self, interface, mMap, texMap):
+    def __init__(self, interface, mMap, texMap, texAliases=None):
         self.yi = interface
         self.materialMap = mMap
         self.textureMap = texMap
+        # textures sharing the engine texture of another one
+        self.textureAliases = texAliases if texAliases is not None else {}
+        # materials with the same parameters share one engine material:
+        # parameters hash -> (engine name, material), namehash -> engine name
+        self.sharedMaterials = {}
+        self.canonicalNames = {}
+        self.merged = 0
 
     def namehash(self, obj):
         nh = obj.name + "-" + str(obj.__hash__())
         return nh
 
+    def engineName(self, mat):
+        # name of the engine material created for 'mat'
+        nh = self.namehash(mat)
+        return self.canonicalNames.get(nh, nh)
+
     def getUsedTextures(self, material):
         used_textures = []
         for tex_slot in material.texture_slots:
@@ -155,7 +197,7 @@ class TheBountyMaterialWrite:
         yi.paramsSetString("element", "shader_node")
         yi.paramsSetString("type", "texture_mapper")
         yi.paramsSetString("name", name)
-        yi.paramsSetString("texture", texname)
+        yi.paramsSetString("texture", self.textureAliases.get(texname, texname))
         
         # get texture coords, default is 'orco'
         texco = switchTextureCoordinates.get(mtex.texture_coords, 'orco')
@@ -538,10 +580,10 @@ class TheBountyMaterialWrite:
         yi.paramsSetString("type", "blend_mat")
         
         mat1 = bpy.data.materials[mat.bounty.blendOne]
-        yi.paramsSetString("material1", self.namehash(mat1))
+        yi.paramsSetString("material1", self.engineName(mat1))
         #
         mat2 = bpy.data.materials[mat.bounty.blendTwo]
-        yi.paramsSetString("material2", self.namehash(mat2))
+        yi.paramsSetString("material2", self.engineName(mat2))
         
         i = 0
 
@@ -597,27 +639,47 @@ class TheBountyMaterialWrite:
 
     def writeMaterial(self, mat, preview=False):
         self.preview = preview
-        self.yi.printInfo("Exporter: Creating Material: \"" + self.namehash(mat) + "\"")
-        ymat = None
+        yi = self.yi
+        self.yi = MaterialRecorder(yi)
+        try:
+            self.writeShader(mat)
+        finally:
+            recorder, self.yi = self.yi, yi
+
+        name = self.namehash(mat)
+        key = recorder.key()
+        shared = self.sharedMaterials.get(key)
+        if shared is not None:
+            yi.printInfo("Exporter: Material \"{0}\" is identical to \"{1}\"".format(name, shared[0]))
+            self.canonicalNames[name] = shared[0]
+            self.materialMap[mat] = shared[1]
+            self.merged += 1
+            return
+
+        yi.printInfo("Exporter: Creating Material: \"" + name + "\"")
+        recorder.replay(yi)
+        ymat = yi.createMaterial(name)
+        self.sharedMaterials[key] = (name, ymat)
+        self.materialMap[mat] = ymat
+
+    def writeShader(self, mat):
         if mat.name == "y_null":
-            ymat = self.writeNullMat(mat)
+            self.writeNullMat(mat)
             
         elif mat.bounty.mat_type in {"glass", "rough_glass"}:
-            ymat = self.writeGlassShader(mat)
+            self.writeGlassShader(mat)
             
         elif mat.bounty.mat_type in {"glossy", "coated_glossy"}:
-            ymat = self.writeGlossyShader(mat)
+            self.writeGlossyShader(mat)
             
         elif mat.bounty.mat_type == "shinydiffusemat":
-            ymat = self.writeShinyDiffuseShader(mat)
+            self.writeShinyDiffuseShader(mat)
             
         elif mat.bounty.mat_type == "blend":
-            ymat = self.writeBlendShader(mat)
+            self.writeBlendShader(mat)
         #
         elif mat.bounty.mat_type == "translucent":
-            ymat = self.writeTranslucentShader(mat)
+            self.writeTranslucentShader(mat)
         #
         else:
-            ymat = self.writeNullMat(mat)
-
-        self.materialMap[mat] = ymat
+            self.writeNullMat(mat)
@@ -24,6 +24,8 @@ import time
 import math
 import mathutils
 import yafrayinterface
+from . import tby_geometry
+from .tby_geometry import np
 
 
 def multiplyMatrix4x4Vector4(matrix, vector):
@@ -35,10 +37,13 @@ def multiplyMatrix4x4Vector4(matrix, vector):
 
 
 class exportObject(object):
-    def __init__(self, yi, mMap, preview):
+    def __init__(self, yi, mMap, preview, meshCache=None, session=None):
         self.yi = yi
         self.materialMap = mMap
         self.is_preview = preview
+        self.meshCache = meshCache
+        self.session = session
+        self.batchStrands = True
 
     def setScene(self, scene):
 
@@ -128,21 +133,6 @@ class exportObject(object):
         yi.paramsSetPoint("to", to[0], to[1], to[2])
         yi.createCamera("cam")
 
-    def getBBCorners(self, obj):
-        bb = obj.bound_box   # look bpy.types.Object if there is any problem
-
-        bbmin = [1e10, 1e10, 1e10]
-        bbmax = [-1e10, -1e10, -1e10]
-
-        for corner in bb:
-            for i in range(3):
-                if corner[i] < bbmin[i]:
-                    bbmin[i] = corner[i]
-                if corner[i] > bbmax[i]:
-                    bbmax[i] = corner[i]
-
-        return bbmin, bbmax
-
     def get4x4Matrix(self, matrix):
 
         ret = yafrayinterface.matrix4x4_t()
@@ -188,8 +178,6 @@ class exportObject(object):
 
     def writeInstance(self, oID, obj2WorldMatrix, name):
 
-        self.yi.printInfo("Exporting Instance of {0} [ID = {1:d}]".format(name, oID))
-
         mat4 = obj2WorldMatrix.to_4x4()
         # mat4.transpose() --> not needed anymore: matrix indexing changed with Blender rev.42816
 
@@ -199,6 +187,17 @@ class exportObject(object):
         del mat4
         del o2w
 
+    def writeInstances(self, oID, matrices, name):
+        # all transforms of one base mesh, one log line per base
+        self.yi.printInfo("Exporting {0} Instances of {1} [ID = {2:d}]".format(len(matrices), name, oID))
+
+        if tby_geometry.hasBulkInstances(self.yi):
+            # contiguous float32 array, 16 values per instance (row major)
+            self.yi.addInstances(oID, tby_geometry.getMatrixArray(matrices).ravel())
+        else:
+            for matrix in matrices:
+                self.writeInstance(oID, matrix, name)
+
     def writeMesh(self, object, matrix):
 
         self.yi.printInfo("Exporting Mesh: {0}".format(object.name))
@@ -328,14 +327,45 @@ class exportObject(object):
 
     def writeGeometry(self, ID, obj, matrix, obType=0, oMat=None):
 
+        bulk = tby_geometry.hasBulkGeometry(self.yi)
+        cacheKey = None
+        sessionKey = None
+        # clay render: one material, no textures, so no UV or orco either
+        clay = self.scene.bounty.gs_clay_render
+
+        if np is not None and (self.meshCache is not None or self.session is not None) and obj.type == 'MESH':
+            # a cache hit skips 'to_mesh' and the mesh walk altogether, with
+            # or without the bulk calls
+            hasUV = len(obj.data.uv_textures) > 0 and not clay
+            flags = (self.is_preview, self.hasOrco(obj.data.materials) and not clay, hasUV)
+            fingerprint = tby_geometry.meshFingerprint(obj, self.scene, flags)
+
+            if self.session is not None:
+                # arrays of the last render kept in object space, so a moved
+                # object only needs its vertices transformed again
+                sessionKey = fingerprint.hexdigest()
+                self.session.seenMeshes.add(obj.name)
+                known = self.session.meshArrays.get(obj.name)
+                if known is not None and known[0] == sessionKey:
+                    self.session.tracker.count('meshes', True)
+                    self.writeTriMeshArrays(ID, obj, tby_geometry.placeTriMeshArrays(known[1], matrix), obType, oMat)
+                    return
+
+            if self.meshCache is not None:
+                cacheKey = tby_geometry.placedMeshKey(fingerprint, matrix)
+                path = self.meshCache.lookup(cacheKey)
+                arrays = tby_geometry.loadTriMeshArrays(path) if path else None
+                if arrays is not None:
+                    self.yi.printInfo("Exporter: Using cached mesh for: {0}".format(obj.name))
+                    self.writeTriMeshArrays(ID, obj, arrays, obType, oMat)
+                    return
+
         mesh = obj.to_mesh(self.scene, True, 'RENDER')
-        isSmooth = False
-        hasOrco = False
         # test for UV Map after BMesh API changes
         uv_texture = mesh.tessface_uv_textures if 'tessface_uv_textures' in dir(mesh) else mesh.uv_textures
         # test for faces after BMesh API changes
         face_attr = 'faces' if 'faces' in dir(mesh) else 'tessfaces'
-        hasUV = len(uv_texture) > 0  # check for UV's
+        hasUV = len(uv_texture) > 0 and not clay  # check for UV's
 
         if face_attr == 'tessfaces':
             if not mesh.tessfaces and mesh.polygons:
@@ -353,60 +383,101 @@ class exportObject(object):
                 return
 
         # Check if the object has an orco mapped texture
-        for mat in [mmat for mmat in mesh.materials if mmat is not None]:
-            for m in [mtex for mtex in mat.texture_slots if mtex is not None]:
-                if m.texture_coords == 'ORCO':
-                    hasOrco = True
-                    break
-            if hasOrco:
-                break
+        hasOrco = self.hasOrco(mesh.materials) and not clay
+
+        if (bulk or sessionKey is not None or cacheKey is not None) and face_attr == 'tessfaces':
+            if sessionKey is not None:
+                arrays = self.getTriMeshArrays(obj, mesh, None, uv_texture, hasOrco, hasUV)
+                self.session.meshArrays[obj.name] = (sessionKey, arrays)
+                self.session.tracker.count('meshes', False)
+                arrays = tby_geometry.placeTriMeshArrays(arrays, matrix)
+            else:
+                arrays = self.getTriMeshArrays(obj, mesh, matrix, uv_texture, hasOrco, hasUV)
+            if cacheKey is not None:
+                self.meshCache.store(cacheKey, lambda path: tby_geometry.saveTriMeshArrays(path, arrays))
+            bpy.data.meshes.remove(mesh)
+            self.writeTriMeshArrays(ID, obj, arrays, obType, oMat)
+            return
 
-        # normalized vertex positions for orco mapping
-        ov = []
+        self.yi.paramsClearAll()
+        self.yi.startGeometry()
 
-        if hasOrco:
-            # Keep a copy of the untransformed vertex and bring them
-            # into a (-1 -1 -1) (1 1 1) bounding box
-            bbMin, bbMax = self.getBBCorners(obj)
+        isSmooth = self.writeTriMesh(ID, obj, mesh, matrix, uv_texture, face_attr, hasOrco, hasUV, obType, oMat)
+        if isSmooth:
+            self.yi.smoothMesh(0, self.getSmoothAngle(obj, mesh))
 
-            delta = []
+        self.yi.endGeometry()
 
-            for i in range(3):
-                delta.append(bbMax[i] - bbMin[i])
-                if delta[i] < 0.0001:
-                    delta[i] = 1
+        bpy.data.meshes.remove(mesh)
 
-            # use untransformed mesh's vertices
-            for v in mesh.vertices:
-                normCo = []
-                for i in range(3):
-                    normCo.append(2 * (v.co[i] - bbMin[i]) / delta[i] - 1)
+    def hasOrco(self, materials):
+        for mat in [mmat for mmat in materials if mmat is not None]:
+            for m in [mtex for mtex in mat.texture_slots if mtex is not None]:
+                if m.texture_coords == 'ORCO':
+                    return True
+        return False
+
+    def getSmoothAngle(self, obj, mesh):
+        if mesh.use_auto_smooth:
+            return math.degrees(mesh.auto_smooth_angle)
+        elif obj.type == 'FONT':  # getting nicer result with smooth angle 60 degr. for text objects
+            return 60
+        return 181
+
+    def writeTriMesh(self, ID, obj, mesh, matrix, uv_texture, face_attr, hasOrco, hasUV, obType, oMat):
+        # per element path, used when the interface has no bulk entry points
+        isSmooth = False
 
-                ov.append([normCo[0], normCo[1], normCo[2]])
+        # untransformed vertex positions, normalized for orco mapping
+        ov = None
+        if hasOrco:
+            if np is not None:
+                ov = tby_geometry.getOrcoArray(tby_geometry.getVertexArray(mesh)).tolist()
+            else:
+                ov = tby_geometry.getOrcoList([v.co[:] for v in mesh.vertices])
 
         # Transform the mesh after orcos have been stored and only if matrix exists
         if matrix is not None:
             mesh.transform(matrix)
 
-        self.yi.paramsClearAll()
-        self.yi.startGeometry()
-
         self.yi.startTriMesh(ID, len(mesh.vertices), len(getattr(mesh, face_attr)), hasOrco, hasUV, obType)
 
-        for ind, v in enumerate(mesh.vertices):
-            if hasOrco:
-                self.yi.addVertex(v.co[0], v.co[1], v.co[2], ov[ind][0], ov[ind][1], ov[ind][2])
-            else:
-                self.yi.addVertex(v.co[0], v.co[1], v.co[2])
+        if np is not None:
+            coords = tby_geometry.getVertexArray(mesh).tolist()
+        else:
+            coords = [v.co[:] for v in mesh.vertices]
+
+        if hasOrco:
+            for co, oco in zip(coords, ov):
+                self.yi.addVertex(co[0], co[1], co[2], oco[0], oco[1], oco[2])
+        else:
+            for co in coords:
+                self.yi.addVertex(co[0], co[1], co[2])
+
+        # engine material of every material index, looked up once per object
+        if oMat:
+            matTable = [oMat]
+        else:
+            matTable = self.getMaterialTable(mesh.materials, obj.material_slots)
+        lastMat = len(matTable) - 1
+
+        # each distinct uv value is sent once and shared by the triangles
+        uvIndex = {}
+        uvCorners = 0
+
+        def addUV(u, v):
+            key = (u, v)
+            uvi = uvIndex.get(key)
+            if uvi is None:
+                uvi = uvIndex[key] = self.yi.addUV(u, v)
+            return uvi
 
         for index, f in enumerate(getattr(mesh, face_attr)):
+            uvCorners += len(f.vertices)
             if f.use_smooth:
                 isSmooth = True
 
-            if oMat:
-                ymaterial = oMat
-            else:
-                ymaterial = self.getFaceMaterial(mesh.materials, f.material_index, obj.material_slots)
+            ymaterial = matTable[min(f.material_index, lastMat)]
 
             co = None
             if hasUV:
@@ -416,9 +487,9 @@ class exportObject(object):
                 else:
                     co = uv_texture.active.data[index].uv
 
-                uv0 = self.yi.addUV(co[0][0], co[0][1])
-                uv1 = self.yi.addUV(co[1][0], co[1][1])
-                uv2 = self.yi.addUV(co[2][0], co[2][1])
+                uv0 = addUV(co[0][0], co[0][1])
+                uv1 = addUV(co[1][0], co[1][1])
+                uv2 = addUV(co[2][0], co[2][1])
 
                 self.yi.addTriangle(f.vertices[0], f.vertices[1], f.vertices[2], uv0, uv1, uv2, ymaterial)
             else:
@@ -426,39 +497,132 @@ class exportObject(object):
 
             if len(f.vertices) == 4:
                 if hasUV:
-                    uv3 = self.yi.addUV(co[3][0], co[3][1])
+                    uv3 = addUV(co[3][0], co[3][1])
                     self.yi.addTriangle(f.vertices[0], f.vertices[2], f.vertices[3], uv0, uv2, uv3, ymaterial)
                 else:
                     self.yi.addTriangle(f.vertices[0], f.vertices[2], f.vertices[3], ymaterial)
 
         self.yi.endTriMesh()
 
-        if isSmooth and mesh.use_auto_smooth:
-            self.yi.smoothMesh(0, math.degrees(mesh.auto_smooth_angle))
-        elif isSmooth and obj.type == 'FONT':  # getting nicer result with smooth angle 60 degr. for text objects
-            self.yi.smoothMesh(0, 60)
-        elif isSmooth:
-            self.yi.smoothMesh(0, 181)
+        if hasUV:
+            tby_geometry.printUVWeld(self.yi, obj.name, uvCorners, len(uvIndex))
 
-        self.yi.endGeometry()
+        return isSmooth
 
-        bpy.data.meshes.remove(mesh)
+    def getTriMeshArrays(self, obj, mesh, matrix, uv_texture, hasOrco, hasUV):
+        # bulk path: whole mesh read with foreach_get into triangulated arrays
+        co = tby_geometry.getVertexArray(mesh)
+        verts, matIndex, smooth = tby_geometry.getFaceArrays(mesh)
+        isQuad = tby_geometry.getQuadMask(verts)
+        tris, triFace = tby_geometry.triangulate(verts, isQuad)
 
-    def getFaceMaterial(self, meshMats, matIndex, matSlots):
+        # orco from the untransformed vertices, sent along with the positions
+        orco = tby_geometry.getOrcoArray(co) if hasOrco else None
 
-        ymaterial = self.materialMap["default"]
+        if matrix is not None:
+            co = tby_geometry.transformVertexArray(co, matrix)
+
+        uv = uvTris = None
+        if hasUV:
+            uvLayer = uv_texture[0] if self.is_preview else uv_texture.active
+            faceUV = tby_geometry.getFaceUVArray(uvLayer, len(verts))
+            corners, uvTris = tby_geometry.triangulateFaceUVs(faceUV, isQuad)
+            uv, uvTris = tby_geometry.weldUVs(corners, uvTris)
+            tby_geometry.printUVWeld(self.yi, obj.name, len(corners), len(uv))
+
+        return {
+            'co': co,
+            'orco': orco,
+            'tris': tris,
+            'uv': uv,
+            'uvTris': uvTris,
+            'triMat': matIndex[triFace],
+            'smooth': np.array(smooth.any()),
+            'smoothAngle': np.array(self.getSmoothAngle(obj, mesh), dtype=np.float32),
+        }
+
+    def writeTriMeshArrays(self, ID, obj, arrays, obType, oMat):
+        # hand the arrays to the interface, in a few buffer sized calls when it has them
+        co = arrays['co']
+        orco = arrays['orco']
+        tris = arrays['tris']
+        uvTris = arrays['uvTris']
+        hasOrco = orco is not None
+        hasUV = uvTris is not None
 
-        if self.scene.bounty.gs_clay_render:
-            ymaterial = self.materialMap["clay"]
-        elif len(meshMats) and meshMats[matIndex]:
-            mat = meshMats[matIndex]
-            if mat in self.materialMap:
-                ymaterial = self.materialMap[mat]
+        self.yi.paramsClearAll()
+        self.yi.startGeometry()
+        self.yi.startTriMesh(ID, len(co), len(tris), hasOrco, hasUV, obType)
+
+        bulk = tby_geometry.hasBulkGeometry(self.yi)
+        if bulk:
+            if hasOrco:
+                self.yi.addVertices(co.ravel(), orco.ravel())
+            else:
+                self.yi.addVertices(co.ravel())
+            if hasUV:
+                uvTris = uvTris + self.yi.addUVs(arrays['uv'].ravel())
+        else:
+            # element by element, cached arrays still skip 'to_mesh'
+            if hasOrco:
+                for c, o in zip(co.tolist(), orco.tolist()):
+                    self.yi.addVertex(c[0], c[1], c[2], o[0], o[1], o[2])
+            else:
+                for c in co.tolist():
+                    self.yi.addVertex(c[0], c[1], c[2])
+            if hasUV:
+                uvIndex = [self.yi.addUV(u, v) for u, v in arrays['uv'].tolist()]
+                uvTris = np.array(uvIndex, dtype=np.int32)[uvTris]
+
+        # one call per engine material used by the mesh
+        if oMat:
+            matTable = [oMat]
         else:
-            for mat_slots in [ms for ms in matSlots if ms.material in self.materialMap]:
-                ymaterial = self.materialMap[mat_slots.material]
+            matTable = self.getMaterialTable([ms.material for ms in obj.material_slots], obj.material_slots)
+        ymaterials, triGroup = tby_geometry.gatherMaterials(matTable, arrays['triMat'])
+
+        for group, ymaterial in enumerate(ymaterials):
+            select = triGroup == group
+            if not select.any():
+                continue
+            if not bulk:
+                if hasUV:
+                    for t, uvt in zip(tris[select].tolist(), uvTris[select].tolist()):
+                        self.yi.addTriangle(t[0], t[1], t[2], uvt[0], uvt[1], uvt[2], ymaterial)
+                else:
+                    for t in tris[select].tolist():
+                        self.yi.addTriangle(t[0], t[1], t[2], ymaterial)
+            elif hasUV:
+                self.yi.addTriangles(np.ascontiguousarray(tris[select]).ravel(),
+                                     np.ascontiguousarray(uvTris[select]).ravel(), ymaterial)
+            else:
+                self.yi.addTriangles(np.ascontiguousarray(tris[select]).ravel(), ymaterial)
+
+        self.yi.endTriMesh()
+
+        if arrays['smooth']:
+            self.yi.smoothMesh(0, float(arrays['smoothAngle']))
+
+        self.yi.endGeometry()
+
+    def getMaterialTable(self, meshMats, matSlots):
+        # clay render overrides every material
+        if self.scene.bounty.gs_clay_render:
+            return [self.materialMap["clay"]]
 
-        return ymaterial
+        # used by faces without a valid mesh material
+        yfallback = self.materialMap["default"]
+        for mat_slots in [ms for ms in matSlots if ms.material in self.materialMap]:
+            yfallback = self.materialMap[mat_slots.material]
+
+        matTable = []
+        for mat in meshMats:
+            if mat:
+                matTable.append(self.materialMap.get(mat, self.materialMap["default"]))
+            else:
+                matTable.append(yfallback)
+
+        return matTable or [yfallback]
     
     def defineStrandValues(self, material):
         #
@@ -472,6 +636,150 @@ class exportObject(object):
             strandShape = material.strand.shape
         return strandStart, strandEnd, strandShape
     
+    def getStrandArrays(self, obj, pSys, hairs, steps):
+        """ Points of the given hairs in one float32 array, plus the offset
+            of the first point of every strand (and the end).
+        """
+        points = np.empty((len(hairs) * steps, 3), dtype=np.float32)
+        offsets = np.empty(len(hairs) + 1, dtype=np.int32)
+        numPoints = 0
+        for strand, particleIdx in enumerate(hairs):
+            offsets[strand] = numPoints
+            for step in range(0, steps):
+                co = pSys.co_hair(obj, particleIdx, step)
+                if not co.length_squared == 0:
+                    points[numPoints] = co
+                    numPoints += 1
+        offsets[-1] = numPoints
+
+        return points[:numPoints], offsets
+
+    def getStrandRoots(self, obj, pSys, numHairs):
+        # first point of every hair, enough to decide which hairs to keep
+        roots = np.empty((numHairs, 3), dtype=np.float32)
+        for particleIdx in range(0, numHairs):
+            roots[particleIdx] = pSys.co_hair(obj, particleIdx, 0)
+        return roots
+
+    def streamStrands(self, obj, pSys, hairs, steps, prtvis, ymat, strandStart, strandEnd, strandShape):
+        # one curve mesh for every strand, sent as the points are sampled
+        yi = self.yi
+        for particleIdx in hairs:
+            CID = yi.getNextFreeID()
+            yi.paramsClearAll()
+            yi.startGeometry()
+            yi.startCurveMesh(CID, prtvis)
+            #initCo = obj.matrix_world.inverted()*(pSys.co_hair(obj, pindex, 0))
+            for step in range(0, steps):
+                co = pSys.co_hair(obj, particleIdx, step)
+                if not co.length_squared == 0:
+                    yi.addVertex(co[0], co[1], co[2])
+            yi.endCurveMesh(ymat, strandStart, strandEnd, strandShape)
+            # TODO: keep object smooth
+            #yi.smoothMesh(CID, 60.0)
+            yi.endGeometry()
+
+    def writeStrands(self, points, offsets, prtvis, ymat, strandStart, strandEnd, strandShape):
+        # one curve mesh for every strand of a gathered batch
+        yi = self.yi
+        points = points.tolist()
+        for first, last in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+            CID = yi.getNextFreeID()
+            yi.paramsClearAll()
+            yi.startGeometry()
+            yi.startCurveMesh(CID, prtvis)
+            for i in range(first, last):
+                yi.addVertex(points[i][0], points[i][1], points[i][2])
+            yi.endCurveMesh(ymat, strandStart, strandEnd, strandShape)
+            yi.endGeometry()
+
+    def writeStrandBatch(self, points, offsets, prtvis, ymat, strandStart, strandEnd, strandShape):
+        # one curve mesh holding a whole batch of strands
+        if not len(points):
+            return
+        yi = self.yi
+        CID = yi.getNextFreeID()
+        yi.paramsClearAll()
+        yi.startGeometry()
+        yi.startCurveMesh(CID, prtvis)
+        yi.addStrands(np.ascontiguousarray(points).ravel(), np.ascontiguousarray(offsets))
+        yi.endCurveMesh(ymat, strandStart, strandEnd, strandShape)
+        yi.endGeometry()
+
+    def writeHairSystem(self, obj, pSys):
+        yi = self.yi
+        yi.printInfo("Exporter: Creating Hair Particle System {!r}".format(pSys.name))
+        tstart = time.time()
+        #-----------------------------------------------
+        # set particle material values. if don't have
+        # material assigned in blender, use default one
+        #-----------------------------------------------
+        strandStart = 0.01
+        strandEnd = 0.01
+        strandShape = 0.0                    
+        hairMat = "default"  
+                            
+        if obj.active_material is not None:
+            hairMat = obj.active_material
+            strandStart, strandEnd, strandShape = self.defineStrandValues(hairMat)
+        # exception: if clay render is activated
+        if self.scene.bounty.gs_clay_render:
+            hairMat = "clay"
+        #
+        pSys.set_resolution(self.scene, obj, 'RENDER')    
+        steps = pSys.settings.draw_step
+        steps = 3 ** steps # or (power of 2 rather than 3) + 1 # Formerly : len(particle.hair_keys)
+        #print(steps)
+                
+        totalNumberOfHairs = ( len(pSys.particles) + len(pSys.child_particles) )
+        #
+        prtvis = True # False
+        #for particle in pSys.particles:
+        #    if particle.is_exist and particle.is_visible:
+        #        prtvis = True
+        ymat = self.materialMap[hairMat]
+        hairs = range(0, totalNumberOfHairs)
+
+        scene = self.scene.bounty
+        view = None
+        if scene.gs_strand_simplify and self.scene.camera and np is not None:
+            view = tby_geometry.cameraView(self.scene)
+            roots = self.getStrandRoots(obj, pSys, totalNumberOfHairs)
+            hairs = tby_geometry.thinStrands(roots, view, scene.gs_strand_thin_distance,
+                                             scene.gs_strand_min_density).tolist()
+
+        if self.batchStrands and np is not None and tby_geometry.hasBulkStrands(yi):
+            mode = "batched"
+        else:
+            mode = "per hair"
+
+        if mode == "batched" or view is not None:
+            # gather, reduce and send one batch of strands at a time
+            numPoints = keptStrands = keptPoints = 0
+            for first in range(0, len(hairs), tby_geometry.strandsPerBatch):
+                batch = hairs[first:first + tby_geometry.strandsPerBatch]
+                points, offsets = self.getStrandArrays(obj, pSys, batch, steps)
+                numPoints += len(points)
+                if view is not None and len(points):
+                    points, offsets = tby_geometry.simplifyStrands(points, offsets, view, scene.gs_strand_error)
+                keptStrands += len(offsets) - 1
+                keptPoints += len(points)
+                if mode == "batched":
+                    self.writeStrandBatch(points, offsets, prtvis, ymat, strandStart, strandEnd, strandShape)
+                else:
+                    self.writeStrands(points, offsets, prtvis, ymat, strandStart, strandEnd, strandShape)
+            if view is not None:
+                yi.printInfo("Exporter: Strand simplify: {0} -> {1} hairs, {2} -> {3} points".format(
+                             totalNumberOfHairs, keptStrands, numPoints, keptPoints))
+        else:
+            self.streamStrands(obj, pSys, hairs, steps, prtvis, ymat, strandStart, strandEnd, strandShape)
+
+        elapsed = time.time() - tstart
+        yi.printInfo("Exporter: Particle creation time: {0:.3f}, {1:.0f} hairs/s ({2})".format(
+                     elapsed, totalNumberOfHairs / max(elapsed, 1e-6), mode))
+
+        return totalNumberOfHairs
+
     def writeParticleStrands(self, obj, matrix):
 
         yi = self.yi
@@ -484,54 +792,7 @@ class exportObject(object):
         for pSys in obj.particle_systems:
             for mod in [m for m in obj.modifiers if (m is not None) and (m.type == 'PARTICLE_SYSTEM')]:
                 if (pSys.settings.render_type == 'PATH') and mod.show_render and (pSys.name == mod.particle_system.name):
-                    yi.printInfo("Exporter: Creating Hair Particle System {!r}".format(pSys.name))
-                    tstart = time.time()
-                    #-----------------------------------------------
-                    # set particle material values. if don't have
-                    # material assigned in blender, use default one
-                    #-----------------------------------------------
-                    strandStart = 0.01
-                    strandEnd = 0.01
-                    strandShape = 0.0                    
-                    hairMat = "default"  
-                                        
-                    if obj.active_material is not None:
-                        hairMat = obj.active_material
-                        strandStart, strandEnd, strandShape = self.defineStrandValues(hairMat)
-                    # exception: if clay render is activated
-                    if self.scene.bounty.gs_clay_render:
-                        hairMat = "clay"
-                    #
-                    pSys.set_resolution(self.scene, obj, 'RENDER')    
-                    steps = pSys.settings.draw_step
-                    steps = 3 ** steps # or (power of 2 rather than 3) + 1 # Formerly : len(particle.hair_keys)
-                    #print(steps)
-                            
-                    totalNumberOfHairs = ( len(pSys.particles) + len(pSys.child_particles) )
-                    #
-                    prtvis = True # False
-                    #for particle in pSys.particles:
-                    #    if particle.is_exist and particle.is_visible:
-                    #        prtvis = True
-                    for particleIdx in range(0, totalNumberOfHairs):
-                        #
-                        #initCo = obj.matrix_world.inverted()*(pSys.co_hair(obj, pindex, 0))
-                        # move here
-                        CID = yi.getNextFreeID()
-                        yi.paramsClearAll()
-                        yi.startGeometry()
-                        yi.startCurveMesh(CID, prtvis)
-                        #
-                        for step in range(0, steps):
-                            co = pSys.co_hair(obj, particleIdx, step)
-                            if not co.length_squared == 0:
-                                yi.addVertex(co[0], co[1], co[2])                            
-                        #
-                        yi.endCurveMesh(self.materialMap[hairMat], strandStart, strandEnd, strandShape)
-                        # TODO: keep object smooth
-                        #yi.smoothMesh(CID, 60.0)
-                        yi.endGeometry()
-                    yi.printInfo("Exporter: Particle creation time: {0:.3f}".format(time.time() - tstart))
+                    totalNumberOfHairs = self.writeHairSystem(obj, pSys)
                     
                     #---------------------------------------------------------------------------------------
                     if pSys.settings.use_render_emitter:
@@ -0,0 +1,95 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import tby_imageio
+from .tby_texlod import materialImageTextures
+from .tby_texture import imageFilePath
+
+# file checks run at once, they mostly wait on the disk or the network
+preflightWorkers = 16
+
+
+class ImageCheck(object):
+    """ What the preflight found about one image file """
+    def __init__(self, path):
+        self.path = path
+        self.exists = False
+        self.fileSize = 0
+        # (width, height, channels, bits per channel), None when unreadable
+        self.header = None
+
+    def run(self):
+        try:
+            self.fileSize = os.stat(self.path).st_size
+            self.exists = True
+        except OSError:
+            return self
+        self.header = tby_imageio.readImageHeader(self.path)
+        return self
+
+    def memory(self):
+        if self.header is None:
+            return 0
+        width, height, channels, depth = self.header
+        return width * height * channels * max(depth // 8, 1)
+
+
+def preflightImages(sceneIndex, yi, loaded=()):
+    """ Checks the image files of the scene textures in parallel before the
+        export, textures in 'loaded' are already in the engine and skipped.
+        Returns image file -> ImageCheck.
+    """
+    tstart = time.time()
+    users = {}
+    for mat in sceneIndex.materials:
+        if mat is None:
+            continue
+        for tex, tiling in materialImageTextures(mat):
+            image = tex.image
+            if image.source == 'FILE' and not image.packed_file and tex.name not in loaded:
+                users.setdefault(imageFilePath(image), set()).add(tex.name)
+    if not users:
+        return {}
+
+    checks = [ImageCheck(path) for path in users]
+    if checks:
+        with ThreadPoolExecutor(max_workers=min(preflightWorkers, len(checks))) as pool:
+            checks = list(pool.map(ImageCheck.run, checks))
+
+    fileSize = 0
+    memory = 0
+    for check in checks:
+        names = ", ".join(sorted(users[check.path]))
+        if not check.exists:
+            yi.printError("Exporter: Image file not found: {0} (texture {1})".format(check.path, names))
+        elif check.header is None:
+            yi.printWarning("Exporter: Unknown or corrupt image file: {0} (texture {1})".format(check.path, names))
+        fileSize += check.fileSize
+        memory += check.memory()
+
+    megabyte = 1024.0 * 1024.0
+    yi.printInfo("Exporter: Image preflight, {0} textures using {1} files, {2:.1f} MB on disk, "
+                 "{3:.1f} MB expected in memory, checked in {4:.3f}s".format(
+                 sum(len(names) for names in users.values()), len(checks),
+                 fileSize / megabyte, memory / megabyte, time.time() - tstart))
+    return dict((check.path, check) for check in checks)
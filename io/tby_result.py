@@ -0,0 +1,175 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+import bpy
+import threading
+import time
+from .tby_geometry import np
+
+# shortest time between two refreshes of the Blender render result
+resultUpdateInterval = 0.25
+# tiles are sent as one rectangle when it covers at most this many times
+# their own area, one by one otherwise
+resultUnionSlack = 1.5
+
+
+def tileArray(pixels, width, height, channels):
+    # engine pixels exposing the buffer protocol are read without copies
+    # to Python objects, others are converted as a sequence of pixels
+    try:
+        data = np.asarray(memoryview(pixels), dtype=np.float32)
+    except TypeError:
+        data = np.asarray(pixels, dtype=np.float32)
+    return data.reshape(height, width, channels)
+
+
+class ResultBuffer(object):
+    """ Float32 copy of the whole render result. Tiles from the engine are
+        written into it, and the Blender result is refreshed from it at a
+        bounded rate with the tiles written since the last refresh, as one
+        rectangle when it is not much larger than the tiles.
+    """
+    def __init__(self, engine, width, height, interval=resultUpdateInterval):
+        self.engine = engine
+        self.width = width
+        self.height = height
+        self.interval = interval
+        self.rgba = np.zeros((height, width, 4), dtype=np.float32)
+        self.depth = np.zeros((height, width, 1), dtype=np.float32)
+        self.lock = threading.Lock()
+        self.dirty = []
+        self.lastUpdate = 0.0
+        # transfer statistics
+        self.tiles = 0
+        self.updates = 0
+        self.bytes = 0
+        self.copyTime = 0.0
+        self.updateTime = 0.0
+
+    def writeTile(self, x, y, w, h, tile):
+        tstart = time.time()
+        rgba, depth = tile
+        self.rgba[y:y + h, x:x + w] = tileArray(rgba, w, h, 4)
+        try:
+            self.depth[y:y + h, x:x + w] = tileArray(depth, w, h, 1)
+        except (TypeError, ValueError):
+            # no depth values in this tile
+            pass
+
+        with self.lock:
+            self.dirty.append((x, y, x + w, y + h))
+            self.tiles += 1
+            self.bytes += w * h * 5 * 4
+            self.copyTime += time.time() - tstart
+
+    def update(self, force=False):
+        now = time.time()
+        with self.lock:
+            if not self.dirty or (not force and now - self.lastUpdate < self.interval):
+                return
+            # a tile rendered again by a later pass is sent once
+            rects = sorted(set(self.dirty))
+            self.dirty = []
+            self.lastUpdate = now
+
+        union = (min(r[0] for r in rects), min(r[1] for r in rects),
+                 max(r[2] for r in rects), max(r[3] for r in rects))
+        area = sum((r[2] - r[0]) * (r[3] - r[1]) for r in rects)
+        if (union[2] - union[0]) * (union[3] - union[1]) <= area * resultUnionSlack:
+            rects = [union]
+        for rect in rects:
+            self.sendRect(*rect)
+        self.updates += 1
+        self.updateTime += time.time() - now
+
+    def sendRect(self, x0, y0, x1, y1):
+        rgba = self.rgba[y0:y1, x0:x1].reshape(-1, 4)
+        depth = self.depth[y0:y1, x0:x1].reshape(-1, 1)
+        result = self.engine.begin_result(x0, y0, x1 - x0, y1 - y0)
+        lay = result.layers[0]
+        try:
+            if bpy.app.version < (2, 74, 4):
+                lay.rect, lay.passes[0].rect = rgba, depth
+            else:
+                lay.passes[0].rect, lay.passes[1].rect = rgba, depth
+        except BaseException:
+            pass
+        self.engine.end_result(result)
+
+    def drawAreaCallback(self, *args):
+        x, y, w, h, tile = args
+        self.writeTile(x, y, w, h, tile)
+        self.update()
+
+    def flushCallback(self, *args):
+        w, h, tile = args
+        self.writeTile(0, 0, w, h, tile)
+        self.update(force=True)
+
+    def report(self, yi):
+        megabytes = self.bytes / (1024.0 * 1024.0)
+        yi.printInfo("Exporter: Tile transfer: {0} tiles, {1:.1f} MB at {2:.1f} MB/s, "
+                     "{3} result updates ({4:.3f}s)".format(self.tiles, megabytes,
+                     megabytes / max(self.copyTime, 1e-6), self.updates, self.updateTime))
+
+
+class ProgressReporter(object):
+    """ progressCallback for the engine. The label is read once at render
+        start, Blender's stats and progress bar are updated at most 'rate'
+        times per second (and on every new tag), with the tile throughput.
+    """
+    def __init__(self, engine, label, rate):
+        self.engine = engine
+        self.label = label
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.tag = ""
+        self.progress = 0.0
+        self.tiles = 0
+        self.start = time.time()
+        self.lastReport = 0.0
+
+    def countTiles(self, drawAreaCallback):
+        def callback(*args):
+            self.tiles += 1
+            drawAreaCallback(*args)
+        return callback
+
+    def progressCallback(self, command, *args):
+        newTag = False
+        if command == "tag":
+            newTag = args[0] != self.tag
+            self.tag = args[0]
+        elif command == "progress":
+            self.progress = args[0]
+
+        now = time.time()
+        if newTag or now - self.lastReport >= self.interval:
+            self.lastReport = now
+            self.report(now)
+
+    def tileRate(self, now):
+        return self.tiles / max(now - self.start, 1e-6)
+
+    def report(self, now):
+        if self.engine.test_break():
+            return
+        self.engine.update_stats("TheBounty Render: ", "{0}: {1} | {2:.1f} tiles/s".format(
+                                 self.label, self.tag, self.tileRate(now)))
+        self.engine.update_progress(self.progress)
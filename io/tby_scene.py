@@ -25,7 +25,7 @@ def computeSceneSize(render):
     return [sizeX, sizeY]
 
 
-def getRenderCoords(scene):
+def getRenderCoords(scene, sceneIndex=None):
     render = scene.render
     [sizeX, sizeY] = computeSceneSize(render)
 
@@ -36,7 +36,10 @@ def getRenderCoords(scene):
 
     cam_data = None
 
-    if scene.objects:
+    if sceneIndex is not None:
+        if sceneIndex.camera:
+            cam_data = sceneIndex.camera.data
+    elif scene.objects:
         for item in scene.objects:
             if item.type == 'CAMERA':
                 cam_data = item.data
@@ -83,12 +86,12 @@ def exportAA(yi, scene):
     yi.paramsSetString("filter_type", scene.AA_filter_type)
 
 
-def exportRenderSettings(yi, scene):
+def exportRenderSettings(yi, scene, sceneIndex=None):
     yi.printInfo("Exporting Render Settings")
 
     render = scene.render
 
-    [sizeX, sizeY, bStartX, bStartY, bsizeX, bsizeY, cam_data] = getRenderCoords(scene)
+    [sizeX, sizeY, bStartX, bStartY, bsizeX, bsizeY, cam_data] = getRenderCoords(scene, sceneIndex)
 
     yi.paramsSetString("camera_name", "cam")
     yi.paramsSetString("integrator_name", "default")
@@ -0,0 +1,97 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+geometryObjectTypes = {'MESH', 'SURFACE', 'CURVE', 'FONT', 'EMPTY'}
+
+
+def layerMask(layers):
+    mask = 0
+    for i, layer in enumerate(layers):
+        if layer:
+            mask |= 1 << i
+    return mask
+
+
+class SceneIndex(object):
+    """ The scene objects sorted out in one pass, read by all export phases
+        (textures, materials, lamps, geometry, camera and light checks).
+    """
+    def __init__(self, scene):
+        self.scene = scene
+        self.camera = None
+        self.lamps = []
+        self.geometry = []
+        self.duplicators = []
+        self.lightGeometry = []
+        self.texturedObjects = []
+        self.materials = []
+        self.byGeometryType = {}
+
+        sceneMask = layerMask(scene.layers)
+        # objects mostly use a few layer combinations, test each one once
+        onVisibleLayer = {}
+        seenMaterials = set()
+
+        for obj in scene.objects:
+            obType = obj.type
+
+            if obType == 'CAMERA':
+                if self.camera is None:
+                    self.camera = obj
+                continue
+
+            slots = obj.material_slots
+            if len(slots):
+                self.texturedObjects.append(obj)
+                for slot in slots:
+                    mat = slot.material
+                    if mat not in seenMaterials:
+                        seenMaterials.add(mat)
+                        self.materials.append(mat)
+
+            if obj.hide_render:
+                continue
+            visible = obj.is_visible(scene)
+
+            if obType == 'LAMP':
+                if visible:
+                    self.lamps.append(obj)
+                continue
+
+            if obType not in geometryObjectTypes:
+                continue
+
+            layers = tuple(obj.layers)
+            onLayer = onVisibleLayer.get(layers)
+            if onLayer is None:
+                onLayer = onVisibleLayer[layers] = bool(layerMask(layers) & sceneMask)
+
+            geometryType = obj.bounty.geometry_type
+            if visible and geometryType in {'mesh_light', 'portal_light'}:
+                self.lightGeometry.append(obj)
+
+            if (visible or obj.hide) and onLayer:
+                self.geometry.append(obj)
+                self.byGeometryType.setdefault(geometryType, []).append(obj)
+                if obj.is_duplicator:
+                    self.duplicators.append(obj)
+
+    def hasLights(self):
+        return bool(self.lamps or self.lightGeometry)
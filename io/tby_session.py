@@ -0,0 +1,374 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+import bpy
+import hashlib
+import yafrayinterface
+from bpy.app.handlers import persistent
+from collections import deque
+from .. import PLUGIN_PATH
+from . import tby_imageio
+from .tby_geometry import hashProperties, hashMatrix, hasCalls
+
+# An engine interface kept alive between renders. Plugins are loaded once,
+# and when the interface can clear everything except a given set of names:
+#
+#   yi.clearAllExcept(textureNames, materialNames)
+#
+# textures and materials whose data blocks did not change are kept loaded
+# and skipped by the next export. Without it the scene is cleared in full.
+selectiveClearCalls = ('clearAllExcept',)
+
+
+def hasSelectiveClear(yi):
+    return hasCalls(yi, selectiveClearCalls)
+
+
+def textureFingerprint(tex):
+    if tex is None:
+        return None
+    h = hashlib.sha1()
+    hashProperties(h, tex)
+    img = getattr(tex, "image", None)
+    if img is not None:
+        h.update(repr((img.filepath, img.source, img.packed_file is not None,
+                       img.generated_type, img.generated_width, img.generated_height)).encode())
+    return h.hexdigest()
+
+
+def materialFingerprint(mat):
+    h = hashlib.sha1()
+    hashProperties(h, mat)
+    for slot in [ts for ts in mat.texture_slots if ts]:
+        hashProperties(h, slot, 1)
+        h.update(repr(textureFingerprint(slot.texture)).encode())
+    # a blend material is rebuilt when one of its components changes
+    if mat.bounty.mat_type == 'blend':
+        for name in (mat.bounty.blendOne, mat.bounty.blendTwo):
+            component = bpy.data.materials.get(name)
+            if component is not None and component.bounty.mat_type != 'blend':
+                h.update(materialFingerprint(component).encode())
+    return h.hexdigest()
+
+
+def dataFingerprint(struct, matrix=None):
+    # lamps, cameras and worlds: their settings and where they are
+    h = hashlib.sha1()
+    hashProperties(h, struct)
+    if matrix is not None:
+        hashMatrix(h, matrix)
+    return h.hexdigest()
+
+
+def matrixFingerprint(matrix):
+    h = hashlib.sha1()
+    hashMatrix(h, matrix)
+    return h.hexdigest()
+
+
+def settingsFingerprint(scene, preview):
+    # settings every texture and material is created with
+    bounty = scene.bounty
+    return (preview, bounty.gs_clay_render, tuple(bounty.gs_clay_col),
+            bounty.gs_gamma_input, bounty.sc_apply_gammaInput)
+
+
+class UpdateTracker(object):
+    """ Fingerprint of every exported data block, compared render to render,
+        and the count of what was reused or rebuilt by the last export.
+    """
+    categories = ('objects', 'meshes', 'textures', 'materials', 'lamps', 'camera', 'world')
+
+    def __init__(self):
+        self.fingerprints = {}
+        self.reset()
+
+    def reset(self):
+        self.reused = dict.fromkeys(self.categories, 0)
+        self.rebuilt = dict.fromkeys(self.categories, 0)
+
+    def count(self, category, reused, number=1):
+        if reused:
+            self.reused[category] += number
+        else:
+            self.rebuilt[category] += number
+
+    def track(self, category, key, fingerprint):
+        # True when the data block changed since the last render
+        changed = self.fingerprints.get((category, key)) != fingerprint
+        self.fingerprints[(category, key)] = fingerprint
+        self.count(category, not changed)
+        return changed
+
+    def report(self, yi):
+        parts = ["{0} {1}/{2}".format(c, self.reused[c], self.rebuilt[c])
+                 for c in self.categories if self.reused[c] or self.rebuilt[c]]
+        yi.printInfo("Exporter: Update report (reused/rebuilt): {0}".format(", ".join(parts)))
+
+
+class RenderSession(object):
+    """ Interface, loaded plugins and exported textures and materials of one
+        kind of render (final or preview), reused by the next render.
+    """
+    def __init__(self):
+        self.yi = None
+        self.materialMap = {}
+        self.exportedMaterials = set()
+        self.loadedTextures = set()
+        # image textures shared by file and settings, see exportTexture
+        self.imageTextures = {}
+        self.textureAliases = {}
+        # data block -> (fingerprint, engine name) of what the engine holds
+        self.textureFingerprints = {}
+        # texture name -> (image file, file loaded), see exportTexture
+        self.imageFiles = {}
+        self.materialFingerprints = {}
+        # materials sharing an engine material, see TheBountyMaterialWrite
+        self.sharedMaterials = {}
+        self.canonicalNames = {}
+        self.settings = None
+        self.renders = 0
+        self.tracker = UpdateTracker()
+        # object name -> (fingerprint, object space triangle mesh arrays)
+        self.meshArrays = {}
+        self.seenMeshes = set()
+
+    def getInterface(self):
+        if self.yi is None:
+            self.yi = yafrayinterface.yafrayInterface_t()
+            self.yi.loadPlugins(PLUGIN_PATH)
+        return self.yi
+
+    def forget(self):
+        self.materialMap.clear()
+        self.exportedMaterials.clear()
+        self.loadedTextures.clear()
+        self.imageTextures.clear()
+        self.textureAliases.clear()
+        self.textureFingerprints.clear()
+        self.imageFiles.clear()
+        self.materialFingerprints.clear()
+        self.sharedMaterials.clear()
+        self.canonicalNames.clear()
+
+    def staleTextures(self, lodProxies):
+        # changed textures, and the ones loaded from an other file than the
+        # proxy (or full image) selected for this render
+        stale = set()
+        for name in self.loadedTextures:
+            known = self.textureFingerprints.get(name)
+            files = self.imageFiles.get(name)
+            if known is None or known[0] != textureFingerprint(bpy.data.textures.get(name)):
+                stale.add(name)
+            elif files is not None and lodProxies.get(files[0], files[0]) != files[1]:
+                stale.add(name)
+        return stale
+
+    def staleMaterials(self, textures=()):
+        # changed materials, and the ones using one of 'textures'
+        stale = set()
+        for mat in self.exportedMaterials:
+            known = self.materialFingerprints.get(mat)
+            try:
+                if known is None or known[0] != materialFingerprint(mat):
+                    stale.add(mat)
+                elif textures and any(ts and ts.texture and ts.texture.name in textures
+                                      for ts in mat.texture_slots):
+                    stale.add(mat)
+            except ReferenceError:
+                # removed data block
+                stale.add(mat)
+        return stale
+
+    def blendsUsing(self, materials):
+        blends = set()
+        names = set()
+        for mat in materials:
+            try:
+                names.add(mat.name)
+            except ReferenceError:
+                pass
+        for mat in self.exportedMaterials:
+            try:
+                if mat.bounty.mat_type == 'blend' and (mat.bounty.blendOne in names or
+                                                       mat.bounty.blendTwo in names):
+                    blends.add(mat)
+            except ReferenceError:
+                blends.add(mat)
+        return blends
+
+    def prepare(self, scene, preview, lodProxies):
+        """ Clears the engine for the next export, 'lodProxies' are the
+            texture proxies it uses. Returns the number of textures and
+            materials kept loaded.
+        """
+        yi = self.yi
+        settings = settingsFingerprint(scene, preview)
+        self.tracker.reset()
+        self.seenMeshes = set()
+
+        if self.renders and settings == self.settings and hasSelectiveClear(yi):
+            staleTextures = self.staleTextures(lodProxies)
+            # textures sharing a changed image texture go with it, and so do
+            # the materials pointing at it through them
+            staleAliases = set(name for name, shared in self.textureAliases.items()
+                               if shared in staleTextures)
+            staleTextures |= staleAliases
+            staleMaterials = self.staleMaterials(staleAliases)
+            # materials merged into a changed one, then the blends using them
+            staleNames = set(self.materialFingerprints[mat][1] for mat in staleMaterials
+                             if mat in self.materialFingerprints)
+            staleMaterials |= set(mat for mat, (fp, name) in self.materialFingerprints.items()
+                                  if name in staleNames)
+            staleMaterials |= self.blendsUsing(staleMaterials)
+
+            for name in staleTextures:
+                self.loadedTextures.discard(name)
+                self.textureFingerprints.pop(name, None)
+                self.imageFiles.pop(name, None)
+                self.textureAliases.pop(name, None)
+            for key in [k for k, name in self.imageTextures.items() if name in staleTextures]:
+                del self.imageTextures[key]
+            for mat in staleMaterials:
+                self.exportedMaterials.discard(mat)
+                self.materialMap.pop(mat, None)
+                known = self.materialFingerprints.pop(mat, None)
+                if known is not None:
+                    staleNames.add(known[1])
+            for key in [k for k, (name, ymat) in self.sharedMaterials.items() if name in staleNames]:
+                del self.sharedMaterials[key]
+            for nh in [n for n, name in self.canonicalNames.items() if n in staleNames or name in staleNames]:
+                del self.canonicalNames[nh]
+
+            keepTextures = sorted(name for name in self.loadedTextures if name not in self.textureAliases)
+            keepMaterials = sorted(set(name for fp, name in self.materialFingerprints.values()))
+            keepMaterials += [name for key, name in (("default", "defaultMat"), ("clay", "clayMat"))
+                              if key in self.materialMap]
+            yi.clearAllExcept(keepTextures, keepMaterials)
+            kept = len(keepTextures) + len(keepMaterials)
+            self.tracker.count('textures', True, len(keepTextures))
+            self.tracker.count('materials', True, len(self.materialFingerprints))
+        else:
+            if self.renders:
+                yi.clearAll()
+            self.forget()
+            kept = 0
+
+        self.settings = settings
+        self.renders += 1
+        return kept
+
+    def record(self, namehash):
+        # fingerprints of what the last export created
+        for name in self.loadedTextures:
+            if name not in self.textureFingerprints:
+                self.textureFingerprints[name] = (textureFingerprint(bpy.data.textures.get(name)), name)
+                self.tracker.count('textures', False)
+        for mat in self.exportedMaterials:
+            if mat not in self.materialFingerprints:
+                self.materialFingerprints[mat] = (materialFingerprint(mat), namehash(mat))
+                self.tracker.count('materials', False)
+
+        # meshes of objects no longer rendered
+        for name in [n for n in self.meshArrays if n not in self.seenMeshes]:
+            del self.meshArrays[name]
+
+    def free(self):
+        if self.yi is not None:
+            self.yi.clearAll()
+            self.yi = None
+        self.forget()
+        self.renders = 0
+        self.tracker = UpdateTracker()
+        self.meshArrays.clear()
+
+
+# one session for final renders, one for material previews
+sessions = {}
+
+
+def getSession(preview):
+    session = sessions.get(preview)
+    if session is None:
+        session = sessions[preview] = RenderSession()
+    return session
+
+
+def freeSessions():
+    for session in sessions.values():
+        session.free()
+    sessions.clear()
+
+
+class PreparedFrame(object):
+    """ Animation frame exported into an interface of its own while the
+        previous frame rendered, with the engine state 'update' left.
+    """
+    def __init__(self, sceneName, frame, state):
+        self.sceneName = sceneName
+        self.frame = frame
+        self.state = state
+
+    def free(self):
+        yi = self.state.get('yi')
+        if yi is not None:
+            yi.clearAll()
+        self.state = None
+
+
+# frames ready to render, oldest first
+preparedFrames = deque()
+
+
+def takePreparedFrame(sceneName, frame):
+    # frames other than the one asked for are out of date
+    while preparedFrames:
+        prepared = preparedFrames.popleft()
+        if prepared.sceneName == sceneName and prepared.frame == frame:
+            return prepared
+        prepared.free()
+    return None
+
+
+def freePreparedFrames():
+    while preparedFrames:
+        preparedFrames.popleft().free()
+
+
+@persistent
+def renderJobEnded(*args):
+    # prepared frames only live for one render job, and the image files
+    # written in the background are complete when it ends
+    freePreparedFrames()
+    tby_imageio.waitForWrites()
+
+
+def register():
+    for handlers in (bpy.app.handlers.render_complete, bpy.app.handlers.render_cancel):
+        if renderJobEnded not in handlers:
+            handlers.append(renderJobEnded)
+
+
+def unregister():
+    for handlers in (bpy.app.handlers.render_complete, bpy.app.handlers.render_cancel):
+        if renderJobEnded in handlers:
+            handlers.remove(renderJobEnded)
+    renderJobEnded()
+    freeSessions()
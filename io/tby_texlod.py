@@ -0,0 +1,186 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+import bpy
+import hashlib
+import os
+import subprocess
+import time
+from bpy_extras.object_utils import world_to_camera_view
+from concurrent.futures import ThreadPoolExecutor
+from mathutils import Vector
+from . import tby_imageio
+from .tby_scene import computeSceneSize
+from .tby_texture import imageFilePath
+
+# Image textures are replaced by a power of two downscaled proxy when the
+# objects using them never cover enough pixels of the render to show the
+# full resolution. Proxies are written once by background Blender processes
+# into a disk cache.
+
+# largest downscale, and the smallest proxy side
+lodMaxFactor = 8
+lodMinSize = 64
+# texels per covered pixel kept in the proxy
+lodMargin = 1.5
+# images scaled by one background process
+proxyBatch = 8
+
+proxyScript = "\n".join((
+    "import bpy, sys",
+    "args = sys.argv[sys.argv.index('--') + 1:]",
+    "for i in range(0, len(args), 4):",
+    "    source, target, width, height = args[i:i + 4]",
+    "    image = bpy.data.images.load(source)",
+    "    image.scale(int(width), int(height))",
+    "    image.filepath_raw = target",
+    "    image.save()",
+))
+
+
+def projectedSize(scene, camera, obj, width, height):
+    """ Pixels covered on the render by the object bounds, along the larger
+        side. None when the bounds reach behind the camera.
+    """
+    matrix = obj.matrix_world
+    xs = []
+    ys = []
+    for corner in obj.bound_box:
+        co = world_to_camera_view(scene, camera, matrix * Vector(corner))
+        if co.z <= 0.0:
+            return None
+        xs.append(co.x)
+        ys.append(co.y)
+    return max((max(xs) - min(xs)) * width, (max(ys) - min(ys)) * height)
+
+
+def materialImageTextures(mat):
+    # (image texture, how many times it repeats over the surface)
+    materials = [mat]
+    if mat.bounty.mat_type == 'blend':
+        materials += [bpy.data.materials.get(name) for name in (mat.bounty.blendOne, mat.bounty.blendTwo)]
+    for m in materials:
+        if m is None:
+            continue
+        for mtex in m.texture_slots:
+            if not (mtex and mtex.use and mtex.texture):
+                continue
+            tex = mtex.texture
+            if tex.yaf_tex_type != 'IMAGE' or tex.image is None:
+                continue
+            tiling = max(abs(s) for s in mtex.scale)
+            if tex.extension == 'REPEAT':
+                tiling *= max(tex.repeat_x, tex.repeat_y)
+            yield tex, tiling
+
+
+def lodFactor(width, height, required):
+    factor = 1
+    while (factor < lodMaxFactor and
+           max(width, height) / (factor * 2) >= required * lodMargin and
+           min(width, height) / (factor * 2) >= lodMinSize):
+        factor *= 2
+    return factor
+
+
+def proxyKey(path, factor):
+    st = os.stat(path)
+    h = hashlib.sha1(repr((path, st.st_mtime, st.st_size, factor)).encode())
+    return h.hexdigest() + os.path.splitext(path)[1].lower()
+
+
+def requiredSizes(scene, sceneIndex):
+    """ Image file -> texels needed along its larger side, or None when the
+        full resolution may show (an object using it could not be measured).
+    """
+    camera = scene.camera
+    width, height = computeSceneSize(scene.render)
+    geometry = set(sceneIndex.geometry)
+    required = {}
+
+    for obj in sceneIndex.texturedObjects:
+        size = None
+        # duplicated and group objects show up elsewhere than where they are
+        if obj in geometry and not obj.is_duplicator and not obj.users_group:
+            size = projectedSize(scene, camera, obj, width, height)
+        for mat in set(slot.material for slot in obj.material_slots if slot.material):
+            for tex, tiling in materialImageTextures(mat):
+                image = tex.image
+                if image.source != 'FILE' or image.packed_file:
+                    continue
+                path = imageFilePath(image)
+                if size is None or required.get(path, 0) is None:
+                    required[path] = None
+                else:
+                    required[path] = max(required.get(path, 0), size * tiling)
+    return required
+
+
+def runProxyBatch(jobs):
+    args = []
+    for key, source, target, width, height in jobs:
+        args += [source, target, str(width), str(height)]
+    command = [bpy.app.binary_path, "-b", "--factory-startup", "--python-expr", proxyScript, "--"] + args
+    try:
+        subprocess.call(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError as e:
+        print("Exporter: Unable to start texture proxy process: {0}".format(e))
+    return [job for job in jobs if os.path.exists(job[2])]
+
+
+def selectProxies(scene, sceneIndex, cache, yi):
+    """ Image file -> proxy file for the textures the camera sees small,
+        missing proxies are generated in parallel first.
+    """
+    tstart = time.time()
+    proxies = {}
+    jobs = []
+    for path, required in requiredSizes(scene, sceneIndex).items():
+        if required is None:
+            continue
+        header = tby_imageio.readImageHeader(path)
+        if header is None:
+            continue
+        width, height = header[:2]
+        factor = lodFactor(width, height, required)
+        if factor == 1:
+            continue
+        key = proxyKey(path, factor)
+        proxy = cache.lookup(key)
+        if proxy is not None:
+            proxies[path] = proxy
+        else:
+            target = "{0}.{1}.part".format(cache.keyPath(key), os.getpid())
+            jobs.append((key, path, target, width // factor, height // factor))
+
+    if jobs:
+        if not os.path.isdir(cache.directory):
+            os.makedirs(cache.directory)
+        batches = [jobs[i:i + proxyBatch] for i in range(0, len(jobs), proxyBatch)]
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+            for done in pool.map(runProxyBatch, batches):
+                for key, source, target, width, height in done:
+                    proxy = cache.store(key, lambda path: os.replace(target, path))
+                    if proxy is not None:
+                        proxies[source] = proxy
+
+    yi.printInfo("Exporter: Texture LOD, {0} images downscaled ({1} new) in {2:.3f}s".format(
+                 len(proxies), len(jobs), time.time() - tstart))
+    return proxies
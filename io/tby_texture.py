@@ -19,6 +19,7 @@
 # <pep8 compliant>
 
 import bpy
+import hashlib
 import os
 from bpy.path import abspath, clean_name
 
@@ -87,10 +88,86 @@ def noise2string(ntype):
     return a.get(ntype, 'newperlin')
 
 
+def imageFilePath(image):
+    # where an image read from its file is, linked images relative to their library
+    if image.library is not None:
+        path = abspath(image.filepath, library=image.library)
+    else:
+        path = abspath(image.filepath)
+    return os.path.normpath(os.path.realpath(path))
+
+
+def generatedImageKey(scene, image, fileformat):
+    # the generator settings and everything 'save_render' applies. Images
+    # painted over are not cached, hashing their pixels costs more than
+    # baking them again
+    if image.is_dirty:
+        return None
+    h = hashlib.sha1()
+    settings = scene.render.image_settings
+    h.update(repr((image.generated_type, image.generated_width, image.generated_height,
+                   tuple(image.generated_color), image.use_generated_float,
+                   settings.file_format, settings.color_mode, settings.color_depth,
+                   scene.view_settings.view_transform, scene.view_settings.exposure,
+                   scene.view_settings.gamma, scene.display_settings.display_device)).encode())
+    return "{0}.{1}".format(h.hexdigest(), fileformat)
+
+
+def packedImageKey(image):
+    data = getattr(image.packed_file, "data", None)
+    if not data:
+        return None, None
+    ext = os.path.splitext(image.filepath)[1] or ".{0}".format(
+          lowerImageFileExtension.get(image.file_format, 'png'))
+    return hashlib.sha1(data).hexdigest() + ext.lower(), data
+
+
 class exportTexture:
-    def __init__(self, interface):
+    def __init__(self, interface, assetCache=None):
         self.yi = interface
         self.loadedTextures = set()
+        # DiskCache for generated and packed images, keyed by content
+        self.assetCache = assetCache
+        # image textures are created once per image file and settings:
+        # image key -> engine texture, texture name -> engine texture it shares
+        self.imageTextures = {}
+        self.textureAliases = {}
+        # image file -> downscaled proxy file, see tby_texlod
+        self.lodProxies = {}
+        # texture name -> (image file, file loaded: the image or its proxy)
+        self.imageFiles = {}
+        # image file -> ImageCheck, see tby_preflight
+        self.preflight = {}
+
+    def cachedImage(self, scene, image, fileformat):
+        """ Path of a generated or packed image in the asset cache, the file
+            is written on first use only. None when it can not be cached.
+        """
+        if image.source == 'GENERATED':
+            key = generatedImageKey(scene, image, fileformat)
+            if key is None:
+                return None
+
+            def writer(path):
+                try:
+                    image.save_render(path, scene)
+                except RuntimeError as e:
+                    raise IOError(str(e))
+        else:
+            key, data = packedImageKey(image)
+            if key is None:
+                return None
+
+            def writer(path):
+                with open(path, 'wb') as f:
+                    f.write(data)
+
+        path = self.assetCache.lookup(key)
+        if path is None:
+            path = self.assetCache.store(key, writer)
+            if path is not None:
+                self.yi.printInfo("Exporter: Image {0} written to the texture cache".format(image.name))
+        return path
 
     def writeTexture(self, scene, tex):
         name = tex.name
@@ -305,7 +382,12 @@ class exportTexture:
             fileformat = lowerImageFileExtension.get(scene.render.image_settings.file_format,'PNG')
             extract_path = os.path.join(filename, "{:05d}".format(scene.frame_current))
 
-            if tex.image.source == 'GENERATED':
+            # generated and packed images are written once for all frames
+            image_tex = None
+            if self.assetCache is not None and (tex.image.source == 'GENERATED' or tex.image.packed_file):
+                image_tex = self.cachedImage(scene, tex.image, fileformat)
+
+            if image_tex is None and tex.image.source == 'GENERATED':
                 image_tex = "baked_image_{0}.{1}".format(clean_name(tex.name), fileformat)
                 image_tex = os.path.join(save_dir, extract_path, image_tex)
                 image_tex = abspath(image_tex)
@@ -313,7 +395,7 @@ class exportTexture:
                 if not os.path.exists(image_tex):
                     tex.image.save_render(image_tex, scene)
                     
-            if tex.image.source == 'FILE':
+            if image_tex is None and tex.image.source == 'FILE':
                 #
                 image_tex = ''
                 if tex.image.packed_file:
@@ -323,16 +405,33 @@ class exportTexture:
                     image_tex = abspath(tex.image.filepath)                        
                     
                 else:
-                    if tex.image.library is not None:
-                        image_tex = abspath(tex.image.filepath, library=tex.image.library)
-                    else:
-                        image_tex = abspath(tex.image.filepath)
-                    if not os.path.exists(image_tex):
+                    image_tex = imageFilePath(tex.image)
+                    check = self.preflight.get(image_tex)
+                    if not (check.exists if check is not None else os.path.exists(image_tex)):
                         yi.printError("Exporter: Image texture {0} not found on: {1}".format(tex.name, image_tex))
                         return False
 
             image_tex = os.path.realpath(image_tex)
             image_tex = os.path.normpath(image_tex)
+            # downscaled copy when the full resolution is not visible
+            source = image_tex
+            image_tex = self.lodProxies.get(image_tex, image_tex)
+            self.imageFiles[name] = (source, image_tex)
+
+            # everything the engine image texture is created with, the mapping
+            # is set by the material and does not count
+            imageKey = (image_tex, scene.bounty.gs_gamma_input, tex.yaf_use_alpha, tex.use_calculate_alpha,
+                        tex.yaf_is_normal_map, getattr(tex, "interpolation_type", None), tex.extension,
+                        (tex.repeat_x, tex.repeat_y) if tex.extension == 'REPEAT' else None,
+                        (tex.use_checker_even, tex.use_checker_odd) if tex.extension == 'CHECKER' else None,
+                        (tex.crop_min_x, tex.crop_min_y, tex.crop_max_x, tex.crop_max_y), tex.use_flip_axis)
+            shared = self.imageTextures.get(imageKey)
+            if shared is not None and shared != name:
+                yi.printInfo("Exporter: Texture '{0}' shares the image texture of '{1}'".format(name, shared))
+                self.textureAliases[name] = shared
+                self.loadedTextures.add(name)
+                return True
+            self.imageTextures[imageKey] = name
 
             yi.printInfo("Exporter: Creating Texture: '{0}' type {1}: {2}".format(name, tex.yaf_tex_type, image_tex))
 
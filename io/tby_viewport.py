@@ -0,0 +1,420 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+import bgl
+import threading
+import time
+from bpy_extras.view3d_utils import location_3d_to_region_2d
+from . import tby_scene
+from . import tby_session
+from .tby_sceneindex import SceneIndex
+from .tby_geometry import np, hasCalls
+
+# progressive refinement: every pass renders one region pixel out of
+# 'scale' x 'scale', the last one at full resolution
+viewScales = (8, 4, 2, 1)
+# shortest time between two viewport redraws requested by the render thread
+redrawInterval = 0.1
+# view cameras are replaced in place when the interface can remove them:
+#
+#   yi.removeCamera(name)
+#
+# otherwise each view change adds new ones, and the scene is exported again
+# after this many view changes to drop the old ones
+viewCameraCalls = ('removeCamera',)
+viewCameraLimit = 32
+
+
+def canReplaceCameras(yi):
+    return hasCalls(yi, viewCameraCalls)
+
+
+class ParamRecorder(object):
+    """ Stands in for the interface while the render settings are read from
+        the scene on the main thread, the render thread replays the calls.
+        Messages go to 'yi' when given, and are dropped otherwise.
+    """
+    def __init__(self, yi=None):
+        self.yi = yi
+        self.calls = []
+
+    def __getattr__(self, name):
+        if name.startswith("print"):
+            if self.yi is not None:
+                return getattr(self.yi, name)
+            return lambda *args: None
+        if not name.startswith("params"):
+            raise AttributeError(name)
+
+        def record(*args):
+            self.calls.append((name, args))
+        return record
+
+    def replayCall(self, yi, name, args):
+        getattr(yi, name)(*args)
+
+    def replay(self, yi):
+        for name, args in self.calls:
+            self.replayCall(yi, name, args)
+
+
+def viewKey(context):
+    # everything a camera only update depends on
+    rv3d = context.region_data
+    space = context.space_data
+    scene = context.scene
+    key = [context.region.width, context.region.height, rv3d.view_perspective,
+           tuple(v for row in rv3d.view_matrix for v in row), space.lens, rv3d.view_distance]
+    if rv3d.view_perspective == 'CAMERA' and scene.camera:
+        cam = scene.camera.data
+        render = scene.render
+        key += [tuple(v for row in scene.camera.matrix_world for v in row),
+                rv3d.view_camera_zoom, tuple(rv3d.view_camera_offset),
+                render.resolution_x, render.resolution_y, render.pixel_aspect_x, render.pixel_aspect_y,
+                cam.type, cam.lens, cam.ortho_scale, cam.sensor_fit, cam.sensor_width, cam.sensor_height,
+                cam.shift_x, cam.shift_y]
+    return tuple(key)
+
+
+def cameraFrame(context):
+    """ (x, y, width, height) of the scene camera frame drawn in the region,
+        in region pixels, None when it can not be placed.
+    """
+    scene = context.scene
+    camera = scene.camera
+    corners = [location_3d_to_region_2d(context.region, context.region_data, camera.matrix_world * co)
+               for co in camera.data.view_frame(scene)]
+    if any(co is None for co in corners):
+        return None
+    xs = [co.x for co in corners]
+    ys = [co.y for co in corners]
+    x = int(round(min(xs)))
+    y = int(round(min(ys)))
+    return x, y, max(1, int(round(max(xs))) - x), max(1, int(round(max(ys))) - y)
+
+
+def cameraShift(context, width, height):
+    # lens shift as a render window offset, like the final render does
+    rv3d = context.region_data
+    camera = context.scene.camera
+    if rv3d.view_perspective != 'CAMERA' or not camera:
+        return 0, 0
+    size = max(width, height)
+    return int(camera.data.shift_x * size), -int(camera.data.shift_y * size)
+
+
+def setViewCameraParams(yi, context, width, height):
+    rv3d = context.region_data
+    space = context.space_data
+    camera = context.scene.camera
+    cameraView = rv3d.view_perspective == 'CAMERA' and camera is not None
+
+    if cameraView:
+        # rendered at the size of the camera frame, so the render aspect
+        cam = camera.data
+        matrix = camera.matrix_world.copy()
+        ortho = cam.type == 'ORTHO'
+        lens = cam.lens
+        if cam.sensor_fit == 'VERTICAL' or (cam.sensor_fit == 'AUTO' and height > width):
+            sensor = cam.sensor_height if cam.sensor_fit == 'VERTICAL' else cam.sensor_width
+            lens *= height / width
+        else:
+            sensor = cam.sensor_width
+        orthoScale = cam.ortho_scale
+        clip = (cam.clip_start, cam.clip_end)
+    else:
+        # the 3D view frames twice the area of a camera with the same lens
+        matrix = rv3d.view_matrix.inverted()
+        ortho = rv3d.view_perspective == 'ORTHO'
+        lens = space.lens / 2
+        sensor = 32.0
+        orthoScale = 2 * rv3d.view_distance * sensor / space.lens
+        clip = (space.clip_start, space.clip_end)
+
+    pos = matrix.col[3]
+    up = pos + matrix.col[1]
+    to = pos - matrix.col[2]
+
+    yi.paramsClearAll()
+    if ortho:
+        yi.paramsSetString("type", "orthographic")
+        yi.paramsSetFloat("scale", orthoScale)
+    else:
+        yi.paramsSetString("type", "perspective")
+        f_aspect = 1.0 if width > height or cameraView else width / height
+        yi.paramsSetFloat("focal", lens / (f_aspect * sensor))
+    yi.paramsSetFloat("nearClip", clip[0])
+    yi.paramsSetFloat("farClip", clip[1])
+    yi.paramsSetInt("resx", width)
+    yi.paramsSetInt("resy", height)
+    yi.paramsSetPoint("from", pos[0], pos[1], pos[2])
+    yi.paramsSetPoint("up", up[0], up[1], up[2])
+    yi.paramsSetPoint("to", to[0], to[1], to[2])
+
+
+def fillGLBuffer(glBuffer, data):
+    """ Copies the float32 array 'data' into 'glBuffer', a new one when
+        None. Arrays are read as they are where bgl takes them, as lists
+        otherwise.
+    """
+    if glBuffer is None:
+        try:
+            return bgl.Buffer(bgl.GL_FLOAT, [len(data)], data)
+        except TypeError:
+            return bgl.Buffer(bgl.GL_FLOAT, [len(data)], data.tolist())
+    try:
+        glBuffer[:] = data
+    except TypeError:
+        glBuffer[:] = data.tolist()
+    return glBuffer
+
+
+def resampleDisplay(fb, factor, height, width):
+    # previous, coarser pass scaled up as the starting image of the next one
+    out = np.zeros((height, width, 4), dtype=np.float32)
+    if fb is not None:
+        big = np.repeat(np.repeat(fb, factor, axis=0), factor, axis=1)[:height, :width]
+        out[:big.shape[0], :big.shape[1]] = big
+    return out
+
+
+class ViewportRender(object):
+    """ Rendered shading in the 3D view. The scene is exported on the main
+        thread, a background thread renders the view in progressively finer
+        passes. Scene edits export again, view changes only add a camera.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.session = tby_session.RenderSession()
+        self.yi = None
+        self.thread = None
+        self.cancel = threading.Event()
+        self.lock = threading.Lock()
+        self.settings = None
+        self.view = None
+        self.views = 0
+        # region area the render is drawn in: x, y, width, height
+        self.frame = (0, 0, 1, 1)
+        self.width = 0
+        self.height = 0
+        self.gamma = 1.0
+        # newest (framebuffer, scale), shared with the render thread
+        self.display = None
+        self.dirty = False
+        self.lastRedraw = 0.0
+        # (framebuffer of the pass, gamma corrected copy, bgl.Buffer)
+        self.glBuffer = None
+
+    def stop(self):
+        if self.thread is not None:
+            self.cancel.set()
+            # a pass may start right after an abort, so abort until it ends
+            while self.thread.is_alive():
+                self.yi.abort()
+                self.thread.join(0.05)
+        self.thread = None
+
+    def free(self):
+        # rendered shading ended: nothing may touch the engine afterwards
+        self.stop()
+        self.session.free()
+        self.yi = None
+        self.settings = None
+        self.display = None
+        self.glBuffer = None
+
+    def update(self, context):
+        """ The scene changed: export it again and restart the view render """
+        self.stop()
+        if np is None:
+            print("Exporter: Viewport rendering needs numpy")
+            return
+
+        engine = self.engine
+        scene = context.scene
+        tstart = time.time()
+
+        engine.scene = scene
+        engine.sceneIndex = SceneIndex(scene)
+        engine.session = self.session
+        engine.setInterface(self.session.getInterface())
+        self.yi = engine.yi
+        self.yi.setInputGamma(scene.bounty.gs_gamma_input, scene.bounty.sc_apply_gammaInput)
+        self.yi.startScene()
+        engine.exportScene()
+        engine.lightIntegrator.exportIntegrator(scene.bounty, engine.sceneIndex)
+        engine.lightIntegrator.exportVolumeIntegrator(scene)
+        self.session.record(engine.setMaterial.engineName)
+        self.session.tracker.report(self.yi)
+
+        self.settings = ParamRecorder()
+        tby_scene.exportRenderSettings(self.settings, scene, engine.sceneIndex)
+        self.gamma = 1.0 if scene.display_settings.display_device == 'None' else 2.2
+
+        self.yi.printInfo("Exporter: Viewport export time: {0:.3f}s".format(time.time() - tstart))
+        # cameras are added by the next draw
+        self.view = None
+        engine.tag_redraw()
+
+    def createViewCameras(self, context):
+        # one camera per refinement pass, sized to the pass resolution
+        replace = canReplaceCameras(self.yi)
+        self.views += 1
+        cameras = []
+        for scale in viewScales:
+            width = max(1, self.width // scale)
+            height = max(1, self.height // scale)
+            if replace:
+                name = "view.{0}".format(scale)
+                self.yi.removeCamera(name)
+            else:
+                name = "view.{0}.{1}".format(self.views, scale)
+            setViewCameraParams(self.yi, context, width, height)
+            self.yi.createCamera(name)
+            xstart, ystart = cameraShift(context, width, height)
+            cameras.append((name, scale, width, height, xstart, ystart))
+        return cameras
+
+    def draw(self, context):
+        if self.yi is None or self.settings is None:
+            return
+
+        key = viewKey(context)
+        if key != self.view:
+            if self.views >= viewCameraLimit and not canReplaceCameras(self.yi):
+                # drop the cameras of all earlier views with a new export
+                self.views = 0
+                self.update(context)
+                return
+            # camera only update: keep the exported scene, restart the passes
+            self.stop()
+            self.view = key
+            self.frame = (0, 0, context.region.width, context.region.height)
+            if context.region_data.view_perspective == 'CAMERA' and context.scene.camera:
+                self.frame = cameraFrame(context) or self.frame
+            self.width, self.height = self.frame[2:]
+            cameras = self.createViewCameras(context)
+            self.cancel.clear()
+            self.thread = threading.Thread(target=self.run, args=(cameras,))
+            self.thread.daemon = True
+            self.thread.start()
+
+        self.drawDisplay()
+
+    def run(self, cameras):
+        yi = self.yi
+        engine = self.engine
+        previous = None
+
+        for name, scale, width, height, xstart, ystart in cameras:
+            if self.cancel.is_set():
+                return
+            factor = previous[1] // scale if previous else 1
+            fb = resampleDisplay(previous[0] if previous else None, factor, height, width)
+
+            def drawAreaCallback(x, y, w, h, tile):
+                fb[y:y + h, x:x + w] = np.asarray(tile[0], dtype=np.float32).reshape(h, w, 4)
+                self.show(fb, scale)
+
+            def flushCallback(w, h, tile):
+                fb[:h, :w] = np.asarray(tile[0], dtype=np.float32).reshape(h, w, 4)
+                self.show(fb, scale)
+
+            def progressCallback(command, *args):
+                if command == "tag" and not self.cancel.is_set():
+                    engine.update_stats("", "TheBounty Viewport: {0} (1/{1})".format(args[0], scale))
+
+            yi.paramsClearAll()
+            self.settings.replay(yi)
+            yi.paramsSetString("camera_name", name)
+            yi.paramsSetInt("xstart", xstart)
+            yi.paramsSetInt("ystart", ystart)
+            yi.paramsSetInt("width", width)
+            yi.paramsSetInt("height", height)
+            if scale > 1:
+                # coarse passes only need a first look
+                yi.paramsSetInt("AA_passes", 1)
+                yi.paramsSetInt("AA_minsamples", 1)
+
+            yi.render(width, height, 0, 0, False, drawAreaCallback, flushCallback, progressCallback)
+            self.show(fb, scale, force=True)
+            previous = (fb, scale)
+
+    def show(self, fb, scale, force=False):
+        if self.cancel.is_set():
+            return
+        with self.lock:
+            self.display = (fb, scale)
+            self.dirty = True
+        now = time.time()
+        if force or now - self.lastRedraw > redrawInterval:
+            self.lastRedraw = now
+            self.engine.tag_redraw()
+
+    def drawDisplay(self):
+        with self.lock:
+            display = self.display
+            dirty = self.dirty
+            self.dirty = False
+        if display is None:
+            return
+
+        fb, scale = display
+        height, width = fb.shape[:2]
+        if self.glBuffer is None or self.glBuffer[0] is not fb:
+            # a new pass: its copy and buffer are reused until it ends
+            rgba = np.empty((height, width, 4), dtype=np.float32)
+            self.glBuffer = (fb, rgba, None)
+            dirty = True
+        if dirty:
+            fb, rgba, glBuffer = self.glBuffer
+            np.clip(fb[..., :3], 0.0, None, out=rgba[..., :3])
+            np.power(rgba[..., :3], 1.0 / self.gamma, out=rgba[..., :3])
+            rgba[..., 3] = fb[..., 3]
+            self.glBuffer = (fb, rgba, fillGLBuffer(glBuffer, rgba.reshape(-1)))
+        glBuffer = self.glBuffer[2]
+
+        # draw in region pixel space
+        x, y, frameWidth, frameHeight = self.frame
+        viewport = bgl.Buffer(bgl.GL_INT, 4)
+        bgl.glGetIntegerv(bgl.GL_VIEWPORT, viewport)
+        bgl.glMatrixMode(bgl.GL_PROJECTION)
+        bgl.glPushMatrix()
+        bgl.glLoadIdentity()
+        bgl.glOrtho(0, viewport[2], 0, viewport[3], -1, 1)
+        bgl.glMatrixMode(bgl.GL_MODELVIEW)
+        bgl.glPushMatrix()
+        bgl.glLoadIdentity()
+
+        bgl.glEnable(bgl.GL_BLEND)
+        bgl.glBlendFunc(bgl.GL_ONE, bgl.GL_ONE_MINUS_SRC_ALPHA)
+        # a raster position outside the region is invalid, move to the
+        # frame corner from inside it
+        bgl.glRasterPos2i(0, 0)
+        bgl.glBitmap(0, 0, 0, 0, x, y, bgl.Buffer(bgl.GL_BYTE, 1))
+        bgl.glPixelZoom(frameWidth / width, frameHeight / height)
+        bgl.glDrawPixels(width, height, bgl.GL_RGBA, bgl.GL_FLOAT, glBuffer)
+        bgl.glPixelZoom(1, 1)
+        bgl.glDisable(bgl.GL_BLEND)
+
+        bgl.glPopMatrix()
+        bgl.glMatrixMode(bgl.GL_PROJECTION)
+        bgl.glPopMatrix()
+        bgl.glMatrixMode(bgl.GL_MODELVIEW)
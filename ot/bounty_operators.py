@@ -429,6 +429,63 @@ class Thebounty_OT_ParseIBL(Operator):
         return self.iblValues
     
 opClasses.append(Thebounty_OT_ParseIBL)
+
+
+class TheBounty_OT_benchmark_strands(Operator):
+    bl_idname = "object.bounty_benchmark_strands"
+    bl_label = "Benchmark hair export"
+    bl_description = "Export the hair systems of the active object per hair and batched, and report hairs per second"
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return obj and any(p.settings.render_type == 'PATH' for p in obj.particle_systems)
+
+    def execute(self, context):
+        import time
+        import yafrayinterface
+        from .. import PLUGIN_PATH
+        from ..io.tby_object import exportObject
+        from ..io.tby_geometry import hasBulkStrands
+
+        scene = context.scene
+        obj = context.active_object
+
+        yi = yafrayinterface.yafrayInterface_t()
+        yi.setVerbosityMute()
+        yi.loadPlugins(PLUGIN_PATH)
+        yi.startScene()
+        yi.paramsClearAll()
+        yi.paramsSetString("type", "shinydiffusemat")
+        ymat = yi.createMaterial("defaultMat")
+        materialMap = {"default": ymat, "clay": ymat, obj.active_material: ymat}
+
+        geometry = exportObject(yi, materialMap, False)
+        geometry.setScene(scene)
+
+        results = []
+        for batched in (False, True):
+            mode = "batched" if batched else "per hair"
+            if batched and not hasBulkStrands(yi):
+                results.append("{0}: not supported by this engine build".format(mode))
+                continue
+            geometry.batchStrands = batched
+            numHairs = 0
+            tstart = time.time()
+            for pSys in [p for p in obj.particle_systems if p.settings.render_type == 'PATH']:
+                numHairs += geometry.writeHairSystem(obj, pSys)
+            elapsed = max(time.time() - tstart, 1e-6)
+            results.append("{0}: {1:.0f} hairs/s".format(mode, numHairs / elapsed))
+
+        yi.clearAll()
+        del yi
+
+        message = "Hair export, " + ", ".join(results)
+        print(message)
+        self.report({'INFO'}, message)
+        return {'FINISHED'}
+
+opClasses.append(TheBounty_OT_benchmark_strands)
 # test
 
 def register():
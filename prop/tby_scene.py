@@ -140,6 +140,11 @@ class TheBountySceneSettings(bpy.types.PropertyGroup):
             description="Size of the render buckets (tiles)",
             min=8, max=640, default=64
     )    
+    gs_progress_rate = FloatProperty(
+            name="Progress updates/s",
+            description="Maximum number of render progress and stats updates per second",
+            min=0.5, max=60.0, default=4.0
+    )
     gs_tile_order = EnumProperty(
             name="Tile order",
             description="Selects tiles order render type",
@@ -162,6 +167,11 @@ class TheBountySceneSettings(bpy.types.PropertyGroup):
             subtype='COLOR',
             min=0.0, max=1.0,
             default=(0.8, 0.8, 0.8)
+    )
+    gs_clay_fast_lighting = BoolProperty(
+            name="Fast clay lighting",
+            description="In clay render, use direct lighting without caustics or subsurface scattering",
+            default=False
     )    
     gs_mask_render = BoolProperty(
             name="Render mask",
@@ -230,6 +240,89 @@ class TheBountySceneSettings(bpy.types.PropertyGroup):
             description="Instance support leads to effective memory reduction when using duplicates",
             default=False
     )     
+    gs_auto_instances = BoolProperty(
+            name="Auto instances",
+            description="Export objects with identical evaluated meshes and materials\n"
+                        "as instances of one base mesh (found by content hash)",
+            default=False
+    )
+    gs_persistent_session = BoolProperty(
+            name="Persistent session",
+            description="Keep the render engine, its plugins and the unchanged textures\n"
+                        "and materials loaded between renders and material previews",
+            default=False
+    )
+    gs_anim_prefetch = IntProperty(
+            name="Export ahead",
+            description="Animation frames exported while the previous frame renders (0 = off)",
+            min=0, max=4,
+            default=0
+    )
+    gs_mesh_cache = BoolProperty(
+            name="Mesh cache",
+            description="Keep exported meshes in a disk cache and reuse them while\n"
+                        "the object data, modifiers and transform do not change",
+            default=False
+    )
+    gs_mesh_cache_size = IntProperty(
+            name="Cache size (MB)",
+            description="Maximum size of the mesh cache, least recently used meshes are removed first",
+            min=16, max=1048576,
+            default=4096
+    )
+    gs_texture_cache = BoolProperty(
+            name="Texture cache",
+            description="Write generated and packed images once to a disk cache, keyed by\n"
+                        "their content, and reuse them for every frame and render",
+            default=False
+    )
+    gs_texture_preflight = BoolProperty(
+            name="Image preflight",
+            description="Check all image texture files in parallel before the export and\n"
+                        "report missing files, unreadable ones and the expected texture memory",
+            default=True
+    )
+    gs_texture_lod = BoolProperty(
+            name="Texture LOD",
+            description="Use downscaled copies of image textures on objects too small\n"
+                        "in the camera view to show their full resolution",
+            default=False
+    )
+    gs_texture_cache_size = IntProperty(
+            name="Cache size (MB)",
+            description="Maximum size of the texture and texture LOD caches, least recently used images are removed first",
+            min=16, max=1048576,
+            default=2048
+    )
+    gs_cache_dir = StringProperty(
+            name="Cache directory",
+            description="Directory for exporter caches, empty to use Blender's user data folder",
+            subtype='DIR_PATH',
+            default=""
+    )
+    gs_strand_simplify = BoolProperty(
+            name="Simplify strands",
+            description="Drop hair strand points and thin out far hair, within a projected error from the active camera",
+            default=False
+    )
+    gs_strand_error = FloatProperty(
+            name="Pixel error",
+            description="Maximum distance, in pixels, between a simplified strand and the original one",
+            min=0.0, max=16.0, precision=2,
+            default=0.5
+    )
+    gs_strand_thin_distance = FloatProperty(
+            name="Thin distance",
+            description="Distance from the camera where hair density starts to drop (0 to keep all strands)",
+            min=0.0, subtype='DISTANCE',
+            default=0.0
+    )
+    gs_strand_min_density = FloatProperty(
+            name="Min. density",
+            description="Lowest fraction of strands kept for hair far from the camera",
+            min=0.01, max=1.0,
+            default=0.1
+    )
     img_output = EnumProperty(
             name="Image File Type",
             description="Image will be saved in this file format",
@@ -237,6 +330,12 @@ class TheBountySceneSettings(bpy.types.PropertyGroup):
             default='PNG', 
             update=call_update_fileformat
     )    
+    gs_file_in_memory = BoolProperty(
+            name="Write file in background",
+            description="Fill the render result directly from the engine and write the\n"
+                        "image file on a worker thread (PNG, Targa and Radiance HDR)",
+            default=False
+    )
     #--------------------------
     # Integrator properties 
     #--------------------------
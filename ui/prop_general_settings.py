@@ -55,6 +55,7 @@ class THEBOUNTY_PT_pass_settings(RenderButtonsPanel, Panel):
         sub = col.column()
         sub.enabled = scene.gs_clay_render
         sub.prop(scene, "gs_clay_col", text="")
+        sub.prop(scene, "gs_clay_fast_lighting", toggle=True)
 
 class THEBOUNTY_PT_general_settings(RenderButtonsPanel, Panel):
     bl_label = "General Settings"
@@ -87,6 +88,7 @@ class THEBOUNTY_PT_general_settings(RenderButtonsPanel, Panel):
         sub = col.column()
         sub.enabled = scene.gs_type_render == "into_blender"
         sub.prop(scene, "gs_tile_size")
+        sub.prop(scene, "gs_progress_rate")
 
         split = layout.split()
         col = split.column()
@@ -94,6 +96,27 @@ class THEBOUNTY_PT_general_settings(RenderButtonsPanel, Panel):
 
         col = split.column()
         col.prop(scene, "gs_use_instances", text="Use instances", toggle=True)
+        col.prop(scene, "gs_auto_instances", toggle=True)
+        col.prop(scene, "gs_persistent_session", toggle=True)
+        col.prop(scene, "gs_anim_prefetch")
+
+        split = layout.split()
+        col = split.column()
+        col.prop(scene, "gs_mesh_cache", toggle=True)
+        col = split.column()
+        col.enabled = scene.gs_mesh_cache
+        col.prop(scene, "gs_mesh_cache_size")
+        split = layout.split()
+        col = split.column()
+        col.prop(scene, "gs_texture_cache", toggle=True)
+        col.prop(scene, "gs_texture_lod", toggle=True)
+        col.prop(scene, "gs_texture_preflight", toggle=True)
+        col = split.column()
+        col.enabled = scene.gs_texture_cache or scene.gs_texture_lod
+        col.prop(scene, "gs_texture_cache_size")
+        col = layout.column()
+        col.enabled = scene.gs_mesh_cache or scene.gs_texture_cache or scene.gs_texture_lod
+        col.prop(scene, "gs_cache_dir", text="")
         
         split = layout.split(percentage=0.5)
         col = split.column()
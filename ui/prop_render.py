@@ -67,6 +67,9 @@ class TheBounty_PT_output(RenderButtonsPanel, Panel):
         col.prop(scene, "img_output", text="", icon='IMAGE_DATA')
         col = split.column()
         col.row().prop(image_settings, "color_mode", text="Color", expand=True)
+        row = layout.row()
+        row.enabled = scene.gs_type_render == "file" and scene.img_output in {'PNG', 'TARGA', 'HDR'}
+        row.prop(scene, "gs_file_in_memory", toggle=True)
         if scene.img_output == 'OPEN_EXR':
             row = layout.row()
             row.label("Color Depth")
@@ -62,6 +62,19 @@ class TheBounty_PT_strand_settings(Panel):
             else:
                 col.prop(tan, "uv_layer", text="")
 
+        scene = context.scene.bounty
+        layout.separator()
+        layout.prop(scene, "gs_strand_simplify")
+        split = layout.split()
+        split.active = scene.gs_strand_simplify
+        col = split.column()
+        col.prop(scene, "gs_strand_error")
+        col = split.column()
+        col.prop(scene, "gs_strand_thin_distance")
+        col.prop(scene, "gs_strand_min_density")
+
+        layout.operator("object.bounty_benchmark_strands")
+
 
 if __name__ == "__main__":  # only for live edit.
     import bpy